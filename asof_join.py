@@ -0,0 +1,30 @@
+"""
+As-of join of two sensor streams: align the readings of one stream to the samples of another
+"""
+import numpy as np
+
+
+def asof_join(timestamps, other_timestamps, other_values, tolerance=None, combine=np.maximum):
+    """
+    For every timestamp, the value of the latest other reading at or before it that is at
+    most tolerance older (None for any age). Readings that share a timestamp are merged
+    with combine, np.maximum lets any non-zero (on) reading win.
+    Returns (values, matched) aligned to timestamps; unmatched values are 0.
+    Runs in O((n + m) log m), the other stream does not need to be sorted.
+    """
+    timestamps = np.asarray(timestamps)
+    other_timestamps = np.asarray(other_timestamps)
+    other_values = np.asarray(other_values)
+    if not len(other_timestamps):
+        return np.zeros(len(timestamps), dtype=other_values.dtype), np.zeros(len(timestamps), dtype=bool)
+
+    order = np.argsort(other_timestamps, kind='stable')
+    unique_ts, first_idx = np.unique(other_timestamps[order], return_index=True)
+    unique_values = combine.reduceat(other_values[order], first_idx)
+
+    idx = np.searchsorted(unique_ts, timestamps, side='right') - 1
+    matched = idx >= 0
+    idx[~matched] = 0
+    if tolerance is not None:
+        matched &= timestamps - unique_ts[idx] <= tolerance
+    return np.where(matched, unique_values[idx], 0), matched
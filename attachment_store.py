@@ -0,0 +1,137 @@
+"""
+Local attachment store with the mailbox sync state: the UIDVALIDITY and last processed
+UID of the mailbox, and a content-hash index of the saved attachments
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+STATE_FILE = '.sync_state.json'
+PART_SUFFIX = '.part'
+
+
+class PartWriter:
+    """
+    Temporary file next to the attachments that hashes what is written to it
+    """
+
+    def __init__(self, directory):
+        fd, self.path = tempfile.mkstemp(dir=directory, suffix=PART_SUFFIX)
+        self.file = os.fdopen(fd, 'wb')
+        self.hash = hashlib.sha256()
+        self.sha256 = None
+
+    def write(self, data):
+        self.file.write(data)
+        self.hash.update(data)
+
+    def close(self):
+        self.file.close()
+        self.sha256 = self.hash.hexdigest()
+
+    def discard(self):
+        self.file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class AttachmentStore:
+    """
+    Keeps track of what was already downloaded into save_directory so a run only
+    fetches messages newer than last_uid and never rewrites an unchanged attachment.
+
+    State file layout:
+      {"uidvalidity": 1, "last_uid": 42,
+       "files": {"<file name>": {"sha256": "...", "uid": 40}}}
+    """
+
+    def __init__(self, save_directory):
+        self.save_directory = save_directory
+        self.path = os.path.join(save_directory, STATE_FILE)
+        self.uidvalidity = None
+        self.last_uid = 0
+        self.files = {}
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                state = json.load(file)
+            self.uidvalidity = state.get('uidvalidity')
+            self.last_uid = int(state.get('last_uid', 0))
+            self.files = dict(state.get('files', {}))
+        except FileNotFoundError:
+            pass
+        except (ValueError, TypeError, AttributeError) as e:
+            print(f"Ignoring unreadable sync state {self.path}: {e}")
+
+        # Downloads interrupted by a killed run leave their temporary files behind
+        for name in os.listdir(save_directory) if os.path.isdir(save_directory) else []:
+            if name.endswith(PART_SUFFIX):
+                os.remove(os.path.join(save_directory, name))
+
+    def check_uidvalidity(self, uidvalidity):
+        """
+        UIDs are only comparable within one UIDVALIDITY: start over when it changed
+        (or the server did not report one). Content hashes stay valid.
+        """
+        if uidvalidity is None or uidvalidity != self.uidvalidity:
+            if self.last_uid:
+                print(f"Mailbox UIDVALIDITY changed ({self.uidvalidity} -> {uidvalidity}), syncing from scratch")
+            self.uidvalidity = uidvalidity
+            self.last_uid = 0
+            for entry in self.files.values():
+                entry['uid'] = None
+
+    def new_uids(self, uids):
+        """
+        UIDs to fetch: messages above last_uid and messages whose stored file is gone
+        """
+        missing = {entry['uid'] for name, entry in self.files.items()
+                   if not os.path.exists(os.path.join(self.save_directory, name))}
+        return [uid for uid in uids if uid > self.last_uid or uid in missing]
+
+    def open_part(self):
+        return PartWriter(self.save_directory)
+
+    def save(self, uid, file_name, part):
+        """
+        Move a downloaded PartWriter into place as file_name. Returns (path, written); an
+        attachment with the same name and content that is still on disk is kept as it is.
+        """
+        path = os.path.join(self.save_directory, file_name)
+        entry = self.files.get(file_name)
+        written = not (entry and entry.get('sha256') == part.sha256 and os.path.exists(path))
+        if written:
+            os.replace(part.path, path)
+        else:
+            part.discard()
+        self.files[file_name] = {'sha256': part.sha256, 'uid': uid}
+        return path, written
+
+    def files_for(self, uids):
+        """
+        Paths of the stored attachments that came from the given messages, in UID order
+        """
+        uids = set(uids)
+        found = [(entry['uid'], name) for name, entry in self.files.items() if entry.get('uid') in uids]
+        return [os.path.join(self.save_directory, name) for _, name in sorted(found)
+                if os.path.exists(os.path.join(self.save_directory, name))]
+
+    def advance(self, completed_uids, new_uids):
+        """
+        Move last_uid up to the highest new UID below which every message was fully
+        processed, so a failed message is fetched again on the next run
+        """
+        for uid in sorted(uid for uid in new_uids if uid > self.last_uid):
+            if uid not in completed_uids:
+                break
+            self.last_uid = uid
+
+    def write(self):
+        state = {'uidvalidity': self.uidvalidity, 'last_uid': self.last_uid, 'files': self.files}
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(state, file, ensure_ascii=False, indent=1)
+        os.replace(temp_path, self.path)
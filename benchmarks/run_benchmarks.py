@@ -0,0 +1,152 @@
+"""
+Time each stage of the report pipeline on synthetic exports and write the timings to JSON.
+A previous result file can be given to compare against it.
+
+    python benchmarks/run_benchmarks.py --vehicles 50 --days 7 --output results.json
+    python benchmarks/run_benchmarks.py --vehicles 50 --days 7 --compare results.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import fuel_analysis
+from report_scanner import scan_report
+from synthetic_exports import add_arguments, export_parameters, generate_exports
+
+STAGES = ('scan_html', 'load_data', 'parse_data', 'detect_refills', 'load_distances',
+          'build_report', 'export_to_excel', 'main')
+
+
+def _time(function, *args):
+    # Warnings printed by the pipeline would dominate the output of large runs
+    with redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = function(*args)
+        return time.perf_counter() - start, result
+
+
+def _scan(*file_paths):
+    return sum(1 for file_path in file_paths for _ in scan_report(file_path))
+
+
+def _parse(datasets):
+    return [fuel_analysis.parse_data_arrays(series.raw_data, series.engine_data) for series in datasets]
+
+
+def _detect(all_data):
+    return [fuel_analysis.detect_refills(data) for data in all_data]
+
+
+def run_once(fuel_file, road_file, engine_file, output_file):
+    """
+    Run every stage once, each on the output of the stages before it.
+    Returns {stage: seconds}.
+    """
+    timings = {}
+    timings['scan_html'], _ = _time(_scan, fuel_file, engine_file)
+    timings['load_data'], (datasets, identifiers, date_ranges) = _time(
+        fuel_analysis.load_data_from_file, fuel_file, engine_file)
+    timings['parse_data'], _ = _time(_parse, datasets)
+
+    all_data = [series.data for series in datasets]
+    timings['detect_refills'], all_refills = _time(_detect, all_data)
+    analyzed = [(refills, {'num_refills': len(refills), 'first_fuel': data[0][1], 'last_fuel': data[-1][1]}, data)
+                for refills, data in zip(all_refills, all_data)]
+
+    timings['load_distances'], (distances, all_identifiers, dates) = _time(
+        fuel_analysis.load_daily_distances, road_file, identifiers)
+    timings['build_report'], _ = _time(fuel_analysis.build_report, analyzed, identifiers, distances, dates)
+    timings['export_to_excel'], _ = _time(fuel_analysis.export_to_excel, analyzed, identifiers, date_ranges,
+                                          distances, dates, output_file)
+    timings['main'], _ = _time(fuel_analysis.main, fuel_file, road_file, engine_file, 1, 'xlsx', None, output_file)
+    return timings
+
+
+def run(args):
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='fuel_benchmark_')
+    parameters = export_parameters(args)
+    fuel_file, road_file, engine_file, points = generate_exports(data_dir, **parameters)
+    print(f"Generated {points} fuel points for {args.vehicles} vehicles in {data_dir}")
+
+    output_file = os.path.join(data_dir, 'report.xlsx')
+    runs = []
+    for number in range(args.repeat):
+        runs.append(run_once(fuel_file, road_file, engine_file, output_file))
+        print(f"Run {number + 1}/{args.repeat}: " + ", ".join(f"{stage} {runs[-1][stage]:.3f}s" for stage in STAGES))
+
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'parameters': parameters,
+        'points': points,
+        'file_bytes': {os.path.basename(path): os.path.getsize(path) for path in (fuel_file, road_file, engine_file)},
+        'stages': {
+            stage: {
+                'best': min(timings[stage] for timings in runs),
+                'median': statistics.median(timings[stage] for timings in runs),
+                'runs': [timings[stage] for timings in runs],
+            }
+            for stage in STAGES
+        },
+    }
+
+
+def compare(result, baseline, tolerance):
+    """
+    Print the best time of every stage against the baseline.
+    Returns the stages that got slower by more than tolerance (a fraction).
+    """
+    if baseline.get('parameters') != result['parameters']:
+        print("Warning: baseline was measured with different export parameters")
+    slower = []
+    print(f"{'stage':<16}{'baseline':>10}{'current':>10}{'ratio':>8}")
+    for stage in STAGES:
+        if stage not in baseline.get('stages', {}):
+            continue
+        before = baseline['stages'][stage]['best']
+        after = result['stages'][stage]['best']
+        ratio = after / before if before else float('inf')
+        flag = ''
+        if ratio > 1 + tolerance:
+            slower.append(stage)
+            flag = '  slower'
+        print(f"{stage:<16}{before:>9.3f}s{after:>9.3f}s{ratio:>8.2f}{flag}")
+    return slower
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--data-dir', help='where to write the generated exports (a temporary directory by default)')
+    parser.add_argument('--output', help='JSON file for the results')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed slowdown against --compare before failing (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    result = run(args)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(result, file, indent=1)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            slower = compare(result, json.load(file), args.tolerance)
+        if slower:
+            print(f"Slower than the baseline: {', '.join(slower)}")
+            sys.exit(1)
@@ -0,0 +1,157 @@
+"""
+Synthetic GPS portal exports for benchmarking: a fuel report (tulsh.html), an engine
+status report (tog.html) and a road report (zam.html) in the format read by
+load_data_from_file and load_daily_distances.
+
+    python benchmarks/synthetic_exports.py OUTPUT_DIR --vehicles 50 --days 7
+"""
+import argparse
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+OBJECT_TABLE = ('<table class="header"><tr><td>Обьект:</td><td> {identifier} </td></tr>'
+                '<tr><td>Хугацаа:</td><td>{date_range}</td></tr></table>\n')
+CHART_SCRIPT = ('<script type="text/javascript">\n{charts}</script>\n')
+CHART = 'Highcharts.chart("chart{index}", {{"series":[{{"name":"{name}","data":{data},"data_index":{index}}}]}});\n'
+
+
+def _vehicle_day(rng, day_ms, sample_seconds, refills, noise, zero_rate, tank):
+    """
+    One day of a vehicle: engine on for a shift with a few stops, fuel used while on,
+    refills at random times during the shift. Yields (timestamp_ms, fuel, engine_on).
+    """
+    shift_start = rng.uniform(6, 10) * 3600
+    shift_end = shift_start + rng.uniform(6, 12) * 3600
+    stops = sorted(rng.uniform(shift_start, shift_end) for _ in range(rng.randint(0, 3)))
+    stops = [(start, start + rng.uniform(600, 3600)) for start in stops]
+    refill_times = sorted(rng.uniform(shift_start, shift_end) for _ in range(refills))
+    burn_rate = rng.uniform(2, 6) / 3600  # Liters per second while the engine runs
+
+    level = tank['level']
+    second = rng.uniform(0, sample_seconds)
+    while second < 86400:
+        engine_on = shift_start <= second < shift_end and not any(a <= second < b for a, b in stops)
+        step = sample_seconds if engine_on else sample_seconds * 10
+        if engine_on:
+            level -= burn_rate * step
+            while refill_times and refill_times[0] <= second:
+                refill_times.pop(0)
+                # Filling takes a few samples
+                target = min(tank['capacity'], level + tank['capacity'] * rng.uniform(0.2, 0.6))
+                for _ in range(rng.randint(3, 8)):
+                    level += (target - level) / 2
+                    yield day_ms + int(second * 1000), level + rng.gauss(0, noise), True
+                    second += sample_seconds
+                level = target
+        level = max(level, 1.0)
+        reading = 0.0 if rng.random() < zero_rate else level + rng.gauss(0, noise)
+        yield day_ms + int(second * 1000), reading, engine_on
+        second += step * rng.uniform(0.8, 1.2)
+    tank['level'] = level
+
+
+def generate_exports(directory, vehicles=20, days=1, sample_seconds=30, refills_per_day=1.0,
+                     noise=0.3, zero_rate=0.005, two_tank_share=0.1, seed=0, start=None):
+    """
+    Write tulsh.html, tog.html and zam.html into directory.
+    Returns (fuel file, road file, engine file, number of fuel points).
+    """
+    rng = random.Random(seed)
+    start = start or datetime(2024, 3, 1, tzinfo=timezone.utc)
+    date_range = '{} - {}'.format(start.strftime('%Y-%m-%d %H:%M:%S'),
+                                  (start + timedelta(days=days, seconds=-1)).strftime('%Y-%m-%d %H:%M:%S'))
+    fuel_html = ['<html><body>\n']
+    engine_html = ['<html><body>\n']
+    road_html = ['<html><body>\n']
+    points = 0
+
+    for number in range(vehicles):
+        identifier = 'UAZ-%04d' % number
+        tanks = [{'capacity': rng.uniform(60, 120)} for _ in range(2 if rng.random() < two_tank_share else 1)]
+        for tank in tanks:
+            tank['level'] = tank['capacity'] * rng.uniform(0.2, 0.9)
+
+        fuel_arrays = []
+        engine_arrays = []
+        distances = []
+        for tank in tanks:
+            fuel_points = []
+            engine_points = []
+            on_seconds = 0.0
+            for day in range(days):
+                day_ms = int((start + timedelta(days=day)).timestamp() * 1000)
+                refills = int(refills_per_day) + (rng.random() < refills_per_day % 1)
+                last_ms = None
+                for timestamp, fuel, engine_on in _vehicle_day(rng, day_ms, sample_seconds, refills,
+                                                               noise, zero_rate, tank):
+                    fuel_points.append('[%d,"%.2f"]' % (timestamp, fuel))
+                    engine_points.append('[%d,"%d"]' % (timestamp, engine_on))
+                    if engine_on and last_ms is not None:
+                        on_seconds += (timestamp - last_ms) / 1000
+                    last_ms = timestamp
+                # The road report has one row per vehicle and day, driven on the first tank
+                if tank is tanks[0]:
+                    distances.append(on_seconds / 3600 * rng.uniform(20, 45))
+                on_seconds = 0.0
+            points += len(fuel_points)
+            fuel_arrays.append('[' + ','.join(fuel_points) + ']')
+            engine_arrays.append('[' + ','.join(engine_points) + ']')
+
+        header = OBJECT_TABLE.format(identifier=identifier, date_range=date_range)
+        fuel_html.append(header)
+        fuel_html.append(CHART_SCRIPT.format(charts=''.join(
+            CHART.format(index=index, name='Түлш', data=data) for index, data in enumerate(fuel_arrays))))
+        engine_html.append(header)
+        engine_html.append(CHART_SCRIPT.format(charts=''.join(
+            CHART.format(index=index, name='Асаалт', data=data) for index, data in enumerate(engine_arrays))))
+
+        road_html.append(header)
+        rows = ['<tr><td>Огноо</td><td>Зам</td></tr>']
+        for day in range(days):
+            rows.append('<tr><td>%s</td><td>%.2f km</td></tr>' % (
+                (start + timedelta(days=day)).strftime('%Y-%m-%d'), distances[day]))
+        road_html.append('<table class="distances">' + ''.join(rows) + '</table>\n')
+
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for name, html in (('tulsh.html', fuel_html), ('zam.html', road_html), ('tog.html', engine_html)):
+        path = os.path.join(directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.writelines(html)
+            file.write('</body></html>\n')
+        paths.append(path)
+    return paths[0], paths[1], paths[2], points
+
+
+def add_arguments(parser):
+    parser.add_argument('--vehicles', type=int, default=20)
+    parser.add_argument('--days', type=int, default=1)
+    parser.add_argument('--sample-seconds', type=float, default=30, help='seconds between samples while the engine runs')
+    parser.add_argument('--refills-per-day', type=float, default=1.0)
+    parser.add_argument('--noise', type=float, default=0.3, help='standard deviation of the sensor noise in liters')
+    parser.add_argument('--zero-rate', type=float, default=0.005, help='share of zero (dropped) readings')
+    parser.add_argument('--two-tank-share', type=float, default=0.1, help='share of vehicles with two fuel sensors')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def export_parameters(args):
+    return {
+        'vehicles': args.vehicles,
+        'days': args.days,
+        'sample_seconds': args.sample_seconds,
+        'refills_per_day': args.refills_per_day,
+        'noise': args.noise,
+        'zero_rate': args.zero_rate,
+        'two_tank_share': args.two_tank_share,
+        'seed': args.seed,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('output_dir')
+    add_arguments(parser)
+    args = parser.parse_args()
+    fuel_file, road_file, engine_file, points = generate_exports(args.output_dir, **export_parameters(args))
+    print(f"Wrote {points} fuel points to {fuel_file}, {engine_file} and {road_file}")
@@ -1,323 +1,406 @@
 import json
 from datetime import datetime, timedelta
 import tempfile
-from bs4 import BeautifulSoup
-from openpyxl.utils.dataframe import dataframe_to_rows
-import re
-import pandas as pd
+import os
+from bisect import bisect_left, bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import numpy as np
-from openpyxl import Workbook
-from openpyxl.styles import Border, Side, Alignment,Font,PatternFill
+from report_scanner import scan_report
+from instrumentation import count, timed
+from vehicle_registry import IdentifierRegistry
+from parse_diagnostics import ParseDiagnostics
+from asof_join import asof_join
+from refill_alerts import find_refill_burst, REFILL_BURST_WINDOW, REFILL_BURST_THRESHOLD
+from report_model import DailyRow, Refill, VehicleReport, VehicleSummary
+from report_sinks import SINKS, report_tables, write_tables
 
-def parse_data(raw_data, engine_raw_data=None):
+# Points up to this length are parsed together, longer ones in groups of up to twice their length
+POINT_CHARS = 64
+# Points parsed at once: the string arrays of each step take several times the text size
+PARSE_CHUNK_POINTS = 65536
+
+
+def _numeric_mask(tokens):
     """
-    Parse fuel data and filter by engine status if available
+    Which tokens of a string array are decimal numbers (optional sign, point and exponent)
+    or nan/inf, i.e. convert with float() without raising
+    """
+    body = np.char.lstrip(tokens, '+-')
+    signed = np.char.str_len(tokens) - np.char.str_len(body) <= 1
+    valid = np.char.isdecimal(np.char.replace(body, '.', '', 1)) & signed
+
+    # Exponents and nan/inf are rare, check them only on what is not a plain decimal
+    rest = np.flatnonzero(signed & ~valid)
+    if len(rest):
+        body = np.char.lower(body[rest])
+        mantissa, marker, exponent = np.moveaxis(np.char.partition(body, 'e'), -1, 0)
+        exponent_body = np.char.lstrip(exponent, '+-')
+        valid[rest] = ((marker != '') & np.char.isdecimal(np.char.replace(mantissa, '.', '', 1))
+                       & (np.char.str_len(exponent) - np.char.str_len(exponent_body) <= 1)
+                       & np.char.isdecimal(exponent_body)) | np.isin(body, ['nan', 'inf', 'infinity'])
+    return valid
+
+
+def _is_plain_layout(data_str, num_points):
+    """
+    Whether every point of the array is exactly [ts,"val"]: the commas alternate between the
+    one inside a point (before the opening quote) and the one between points (in "],[).
+    Counting tokens is not enough, a point without a value and one with an extra field
+    cancel out and shift every pair between them.
+    """
+    chars = np.frombuffer(data_str.strip('[]').encode(), dtype=np.uint8)
+    commas = np.flatnonzero(chars == ord(','))
+    if (len(commas) != 2 * num_points - 1 or np.count_nonzero(chars == ord('"')) != 2 * num_points
+            or np.count_nonzero(chars == ord('[')) != num_points - 1
+            or np.count_nonzero(chars == ord(']')) != num_points - 1):
+        return False
+    inner, between = commas[0::2], commas[1::2]
+    return bool(chars[-1] == ord('"') and (chars[inner + 1] == ord('"')).all()
+                and (chars[between - 2] == ord('"')).all() and (chars[between - 1] == ord(']')).all()
+                and (chars[between + 1] == ord('[')).all())
+
+
+def _parse_points(raw_data, label, diagnostics=None):
+    """
+    Split a raw `[ts,"val"],[ts,"val"]` array into float64 timestamp and value arrays.
+    Returns the arrays in file order and whether every timestamp was numeric (sortable).
+    Malformed points are dropped and counted in diagnostics (a ParseDiagnostics) if given.
     """
     data_str = raw_data.strip()
-    data_points = [point.strip('[]').split(',') for point in data_str.split('],[')]
-    valid_fuel = None
-    
-    # Parse engine data if provided, handling duplicate timestamps
-    engine_status = {}
-    engine_history = {}  # To track engine status history
-    last_engine_status = 1  # Default to on if no engine data
-    
-    if engine_raw_data:
-        engine_str = engine_raw_data.strip()
-        engine_points = [point.strip('[]').split(',') for point in engine_str.split('],[')]
-        
-        # Sort by timestamp to process in chronological order
+    num_points = data_str.count('],[') + 1
+
+    # Fast path: every point is a well-formed [ts,"val"] pair
+    if _is_plain_layout(data_str, num_points):
+        tokens = data_str.replace('[', '').replace(']', '').replace('"', '').split(',')
         try:
-            engine_points.sort(key=lambda x: float(x[0]))
-        except (ValueError, IndexError):
-            print("Warning: Could not sort engine points")
-        
-        for point in engine_points:
-            if len(point) >= 2:
-                try:
-                    timestamp = float(point[0])
-                    status = int(float(point[1].strip('"')))  # 1 = on, 0 = off
-                    
-                    # Track the history of engine status
-                    if timestamp not in engine_history:
-                        engine_history[timestamp] = []
-                    engine_history[timestamp].append(status)
-                    
-                    # For the same timestamp, if ANY status is 1 (on), consider the engine on
-                    if timestamp in engine_status:
-                        engine_status[timestamp] = max(engine_status[timestamp], status)
-                    else:
-                        engine_status[timestamp] = status
-                    
-                    last_engine_status = status
-                except (ValueError, IndexError) as e:
-                    print(f"Warning: Could not parse engine point: {point}, Error: {str(e)}")
-    
-    # Handle duplicated timestamps in engine data
-    for timestamp in engine_history:
-        if 1 in engine_history[timestamp]:
-            engine_status[timestamp] = 1  # If engine was on at any point at this timestamp, consider it on
-    
-    parsed_data = []
-    fuel_values = set()
-    current_engine_state = last_engine_status  # Start with the last known engine state
-    
+            pairs = np.array(tokens, dtype=np.float64).reshape(num_points, 2)
+            if label != 'engine' or np.isfinite(pairs[:, 1]).all():
+                return pairs[:, 0], pairs[:, 1], True
+        except ValueError:
+            pass
+
+    # Slow path: split the points into fields and drop malformed ones with a validity mask.
+    # Numpy holds every point of an array at the width of the longest one, so points are
+    # parsed in groups of about the same length: one long point does not widen them all.
+    fragments = data_str.split('],[')
+    lengths = np.fromiter(map(len, fragments), dtype=np.int64, count=len(fragments))
+    widths = np.maximum(POINT_CHARS, 2 ** np.ceil(np.log2(np.maximum(lengths, 1)))).astype(np.int64)
+    timestamps = np.zeros(len(fragments))
+    values = np.zeros(len(fragments))
+    keep = np.zeros(len(fragments), dtype=bool)
+    sortable = True
+    for width in np.unique(widths):
+        group = np.flatnonzero(widths == width)
+        for chunk_start in range(0, len(group), PARSE_CHUNK_POINTS):
+            chunk = group[chunk_start:chunk_start + PARSE_CHUNK_POINTS]
+            texts = [fragments[i] for i in chunk]
+            points = np.char.strip(np.array(texts, dtype=f'U{lengths[chunk].max()}'), '[]')
+            timestamps[chunk], values[chunk], keep[chunk], valid_ts = _parse_fields(points, label, diagnostics)
+            sortable = sortable and bool(valid_ts.all())
+    return timestamps[keep], values[keep], sortable
+
+
+def _parse_fields(points, label, diagnostics=None):
+    """
+    Vectorized parse of a string array of `ts,"val"` points. Returns the timestamps,
+    values, which points are valid and which timestamps are numeric.
+    """
+    ts_tokens, separator, value_tokens = np.moveaxis(np.char.partition(points, ','), -1, 0)
+    extra = np.flatnonzero(np.char.find(value_tokens, ',') >= 0)
+    if len(extra):
+        # Fields after the value are ignored
+        value_tokens[extra] = np.char.partition(value_tokens[extra], ',')[..., 0]
+    ts_tokens = np.char.strip(ts_tokens)
+    # Quotes around the value, then whitespace inside them, as float(value.strip('"')) does
+    value_tokens = np.char.strip(np.char.strip(value_tokens, '"'))
+
+    has_value = separator != ''
+    valid_ts = _numeric_mask(ts_tokens)
+    valid_value = _numeric_mask(value_tokens) & has_value
+    # The mask guarantees float() succeeds, which converts faster than astype on string arrays
+    timestamps = np.zeros(len(points))
+    timestamps[valid_ts] = np.fromiter(map(float, ts_tokens[valid_ts].tolist()), dtype=np.float64)
+    values = np.zeros(len(points))
+    values[valid_value] = np.fromiter(map(float, value_tokens[valid_value].tolist()), dtype=np.float64)
+    if label == 'engine':
+        # Engine states are integers, truncated like int()
+        valid_value &= np.isfinite(values)
+        values = np.trunc(values)
+
+    if diagnostics is not None:
+        diagnostics.add(label, "without a value", points[~has_value & (points != '')])
+        diagnostics.add(label, "with a malformed timestamp", points[has_value & ~valid_ts])
+        diagnostics.add(label, "with a malformed value", points[has_value & valid_ts & ~valid_value])
+    return timestamps, values, has_value & valid_ts & valid_value, valid_ts
+
+
+# How much older than a fuel sample an engine reading may be to set its state, in
+# milliseconds (np.inf: any age, 0: only readings at the same millisecond). Functions
+# taking engine_tolerance=None use the value this has when they are called.
+ENGINE_TOLERANCE_MS = np.inf
+
+
+def _engine_tolerance(engine_tolerance):
+    return ENGINE_TOLERANCE_MS if engine_tolerance is None else engine_tolerance
+
+
+def _engine_state(timestamps, engine_raw_data, tolerance, diagnostics=None):
+    """
+    Engine state (1 = on) for each fuel timestamp from an as-of join with the engine
+    readings: the latest reading at or before the sample, within tolerance. Samples
+    without one keep the state of the sample before them.
+    """
+    engine_ts, engine_values, sortable = _parse_points(engine_raw_data, 'engine', diagnostics)
+    status = engine_values.astype(np.int64)
+
+    # Start with the last known engine state, default to on if no engine data
+    if sortable:
+        initial_state = int(status[np.argsort(engine_ts, kind='stable')][-1]) if len(status) else 1
+    else:
+        print("Warning: Could not sort engine points")
+        initial_state = int(status[-1]) if len(status) else 1
+
+    # For the same timestamp, if ANY status is 1 (on), consider the engine on
+    state, matched = asof_join(timestamps, engine_ts, status, tolerance)
+    last_match = np.where(matched, np.arange(len(timestamps)), -1)
+    np.maximum.accumulate(last_match, out=last_match)
+    return np.where(last_match >= 0, state[last_match], initial_state)
+
+
+@timed('parse_data')
+def parse_data_arrays(raw_data, engine_raw_data=None, engine_tolerance=None, diagnostics=None):
+    """
+    Parse fuel data into (timestamps, fuel) float64 arrays, filtered by engine status if available.
+    engine_tolerance limits the age of the engine reading in ms (None: ENGINE_TOLERANCE_MS).
+    Malformed points are counted in diagnostics, without one they are summarized right away.
+    """
+    summarize = diagnostics is None
+    if summarize:
+        diagnostics = ParseDiagnostics()
+    timestamps, fuel, sortable = _parse_points(raw_data, 'fuel', diagnostics)
+    count('points_parsed', len(timestamps))
+
     # Sort data points by timestamp
-    try:
-        data_points.sort(key=lambda x: float(x[0]))
-    except (ValueError, IndexError):
+    if not sortable:
         print("Warning: Could not sort fuel data points")
-    
-    for point in data_points:
-        if len(point) >= 2:
-            try:
-                timestamp = float(point[0])
-                fuel = float(point[1].strip('"'))
-                
-                # Update engine state if we have a reading at this timestamp
-                if timestamp in engine_status:
-                    current_engine_state = engine_status[timestamp]
-                
-                # Only include fuel readings when engine is on (1)
-                if engine_raw_data is None or current_engine_state == 1:
-                    if fuel == 0 and valid_fuel is not None:
-                        fuel = valid_fuel
-                    
-                    if fuel != 0:
-                        valid_fuel = fuel
-                        parsed_data.append((timestamp, fuel))
-                        fuel_values.add(fuel)
-            except (ValueError, IndexError) as e:
-                print(f"Warning: Could not parse fuel point: {point}, Error: {str(e)}")
-    
+    else:
+        order = np.argsort(timestamps, kind='stable')
+        timestamps, fuel = timestamps[order], fuel[order]
+
+    # Only include fuel readings when engine is on (1)
+    if engine_raw_data:
+        engine_on = _engine_state(timestamps, engine_raw_data, _engine_tolerance(engine_tolerance), diagnostics) == 1
+        count('points_dropped_by_engine', len(engine_on) - np.count_nonzero(engine_on))
+        timestamps, fuel = timestamps[engine_on], fuel[engine_on]
+    if summarize:
+        diagnostics.report()
+
+    # Replace zero readings with the last valid (non-zero) reading, drop leading zeros
+    last_valid = np.where(fuel != 0, np.arange(len(fuel)), -1)
+    np.maximum.accumulate(last_valid, out=last_valid)
+    keep = last_valid >= 0
+    timestamps, fuel = timestamps[keep], fuel[last_valid[keep]]
+
     # Check if all fuel values are the same or if we have no valid data
-    if len(fuel_values) <= 1:
+    if len(np.unique(fuel)) <= 1:
+        return None
+    return timestamps, fuel
+
+
+def parse_data(raw_data, engine_raw_data=None):
+    """
+    Parse fuel data and filter by engine status if available
+    """
+    parsed = parse_data_arrays(raw_data, engine_raw_data)
+    if parsed is None:
         return None  # Return None if all fuel values are the same or empty
-    else:
-        return parsed_data
+    timestamps, fuel = parsed
+    return list(zip(timestamps.tolist(), fuel.tolist()))
 
-def load_data_from_file(file_path, engine_file=None):
+class ParsedSeries:
     """
-    Load data from HTML file with optional engine status filtering
+    A fuel data array and its engine data, parsed once by the loader and shared
+    by the analyzer and exporter. Unpacks as the (raw_data, engine_data) pair.
     """
-    with open(file_path, 'r', encoding='utf-8') as file:
-        content = file.read()
+    __slots__ = ('raw_data', 'engine_data', 'timestamps', 'fuel', '_data')
 
-    # Load engine file if provided
-    engine_content = None
-    if engine_file:
-        try:
-            with open(engine_file, 'r', encoding='utf-8') as eng_file:
-                engine_content = eng_file.read()
-        except Exception as e:
-            print(f"Warning: Failed to load engine status data: {str(e)}")
+    def __init__(self, raw_data, engine_data=None, diagnostics=None, engine_tolerance=None):
+        self.raw_data = raw_data
+        self.engine_data = engine_data
+        parsed = parse_data_arrays(raw_data, engine_data, engine_tolerance, diagnostics)
+        self.timestamps, self.fuel = parsed if parsed is not None else (None, None)
+        self._data = None
 
-    soup = BeautifulSoup(content, 'html.parser')
-    engine_soup = BeautifulSoup(engine_content, 'html.parser') if engine_content else None
-    
+    @classmethod
+    def from_arrays(cls, timestamps, fuel):
+        """Wrap already parsed arrays, e.g. when handed to a worker process"""
+        series = cls.__new__(cls)
+        series.raw_data = series.engine_data = None
+        series.timestamps, series.fuel = timestamps, fuel
+        series._data = None
+        return series
+
+    def __iter__(self):
+        return iter((self.raw_data, self.engine_data))
+
+    @property
+    def is_valid(self):
+        return self.timestamps is not None
+
+    @property
+    def data(self):
+        """Parsed points as a list of (timestamp, fuel) tuples, same as parse_data"""
+        if self._data is None and self.is_valid:
+            self._data = list(zip(self.timestamps.tolist(), self.fuel.tolist()))
+        return self._data
+
+
+@timed('load_data')
+def load_data_from_file(file_path, engine_file=None, registry=None, engine_tolerance=None):
+    """
+    Load data from HTML file with optional engine status filtering.
+    Datasets are returned as ParsedSeries so they are not parsed again downstream.
+    The series names of every vehicle are added to registry (an IdentifierRegistry) if given.
+    """
+    registry = registry if registry is not None else IdentifierRegistry()
     datasets = []
-    engine_datasets = []
     identifiers = []
     date_range = None
     identifiers_to_remove = set()
 
-    # Find all script tags and object rows in fuel data
-    all_elements = soup.find_all(['script', 'table'])
     current_identifier = None
     current_datasets = []
 
     # Extract engine data if available
     engine_data_by_identifier = {}
-    if engine_soup:
-        all_engine_elements = engine_soup.find_all(['script', 'table'])
-        current_engine_identifier = None
-        current_engine_datasets = []
-        
-        for element in all_engine_elements:
-            if element.name == 'table':
-                # Process previous identifier's datasets
-                if current_engine_identifier and current_engine_datasets:
-                    engine_data_by_identifier[current_engine_identifier] = current_engine_datasets
-                
-                # Get new identifier
-                object_row = element.find('td', string='Обьект:')
-                if object_row:
-                    current_engine_identifier = object_row.find_next_sibling('td').get_text(strip=True)
+    if engine_file:
+        try:
+            current_engine_identifier = None
+            current_engine_datasets = []
+
+            for event in scan_report(engine_file):
+                if event[0] == 'object':
+                    # Process previous identifier's datasets
+                    if current_engine_identifier and current_engine_datasets:
+                        engine_data_by_identifier[current_engine_identifier] = current_engine_datasets
+
+                    # Get new identifier
+                    current_engine_identifier = event[1]
                     current_engine_datasets = []
-            
-            elif element.name == 'script' and element.string:
-                # Collect engine data matches
-                data_matches = re.findall(r'data":\s*(\[.*?\])\s*,\s*"data_index', element.string, re.DOTALL)
-                current_engine_datasets.extend(data_matches)
-        
-        # Process last identifier's datasets
-        if current_engine_identifier and current_engine_datasets:
-            engine_data_by_identifier[current_engine_identifier] = current_engine_datasets
+
+                elif event[0] == 'data':
+                    # Collect engine data matches
+                    current_engine_datasets.append(event[1])
+
+            # Process last identifier's datasets
+            if current_engine_identifier and current_engine_datasets:
+                engine_data_by_identifier[current_engine_identifier] = current_engine_datasets
+        except Exception as e:
+            print(f"Warning: Failed to load engine status data: {str(e)}")
+            engine_data_by_identifier = {}
+
+    def add_vehicle(identifier, arrays):
+        # Every valid fuel array is one series, paired with the engine array at its position,
+        # and malformed points are summarized once per vehicle
+        engine_arrays = engine_data_by_identifier.get(identifier, [])
+        diagnostics = ParseDiagnostics(identifier)
+        valid_datasets = []
+        for i, dataset in enumerate(arrays):
+            series = ParsedSeries(dataset, engine_arrays[i] if i < len(engine_arrays) else None, diagnostics,
+                                  engine_tolerance)
+            if series.is_valid:
+                valid_datasets.append(series)
+        diagnostics.report()
+
+        if valid_datasets:
+            datasets.extend(valid_datasets)
+            identifiers.extend(registry.add(identifier, len(valid_datasets)))
+        else:
+            identifiers_to_remove.add(identifier)
 
     # Process fuel data
-    for element in all_elements:
-        if element.name == 'table':
-            # Check for object identifier
-            object_row = element.find('td', string='Обьект:')
-            if object_row:
-                # Process previous identifier's datasets if exists
-                if current_identifier and current_datasets:
-                    valid_datasets = []
-                    for i, dataset in enumerate(current_datasets):
-                        # Get corresponding engine data if available
-                        engine_data = None
-                        if current_identifier in engine_data_by_identifier and i < len(engine_data_by_identifier[current_identifier]):
-                            engine_data = engine_data_by_identifier[current_identifier][i]
-                        
-                        parsed_data = parse_data(dataset, engine_data)
-                        if parsed_data is not None:
-                            valid_datasets.append((dataset, engine_data))
-                    
-                    # Add to identifiers and datasets, or mark for removal
-                    if valid_datasets:
-                        # Handle multiple valid datasets for same identifier
-                        if len(valid_datasets) > 1:
-                            datasets.append(valid_datasets[0])
-                            identifiers.append(current_identifier + " 1")
-                            
-                            if len(valid_datasets) >= 2:
-                                datasets.append(valid_datasets[1])
-                                identifiers.append(current_identifier + " 2")
-                                if len(valid_datasets) >= 3:
-                                    datasets.append(valid_datasets[2])
-                                    identifiers.append(current_identifier + " 3")
-                        else:
-                            # Single dataset case
-                            datasets.extend(valid_datasets)
-                            identifiers.append(current_identifier)
-                    else:
-                        identifiers_to_remove.add(current_identifier)
-
-                # Reset for new identifier
-                current_identifier = object_row.find_next_sibling('td').get_text(strip=True)
-                current_datasets = []
-
-                # Check for date range
-                date_row = element.find('td', string='Хугацаа:')
-                if date_row:
-                    date_cell = date_row.find_next_sibling('td')
-                    if date_cell and not date_range:
-                        date_range = date_cell.get_text(strip=True)
-
-        elif element.name == 'script' and element.string:
+    for event in scan_report(file_path):
+        if event[0] == 'object':
+            # Process previous identifier's datasets if exists
+            if current_identifier and current_datasets:
+                add_vehicle(current_identifier, current_datasets)
+
+            # Reset for new identifier
+            current_identifier = event[1]
+            current_datasets = []
+
+            # Check for date range
+            if event[2] is not None and not date_range:
+                date_range = event[2]
+
+        elif event[0] == 'data':
             # Collect fuel data matches
-            data_matches = re.findall(r'data":\s*(\[.*?\])\s*,\s*"data_index', element.string, re.DOTALL)
-            current_datasets.extend(data_matches)
+            current_datasets.append(event[1])
 
     # Process last identifier's datasets
     if current_identifier and current_datasets:
-        valid_datasets = []
-        engine_data = None
-        for i, dataset in enumerate(current_datasets):
-            # Get corresponding engine data if available
-            
-            if current_identifier in engine_data_by_identifier and i < len(engine_data_by_identifier[current_identifier]):
-                engine_data = engine_data_by_identifier[current_identifier][i]
-            
-            parsed_data = parse_data(dataset, engine_data)
-            if parsed_data is not None:
-                valid_datasets.append((dataset, engine_data))
-        
-        if valid_datasets:
-            # Handle multiple valid datasets for same identifier
-            if len(valid_datasets) > 1:
-                datasets.append(valid_datasets[0])
-                identifiers.append(current_identifier + " 1")
-                
-                if len(valid_datasets) >= 2:
-                    datasets.append(valid_datasets[1])
-                    identifiers.append(current_identifier + " 2")
-            else:
-                datasets.extend(valid_datasets)
-                identifiers.append(current_identifier)
-        else:
-            identifiers_to_remove.add(current_identifier)
+        add_vehicle(current_identifier, current_datasets)
 
     # Remove identifiers with no valid data
     final_identifiers = [ident for ident in identifiers if ident not in identifiers_to_remove]
-    
+
     if not datasets:
         raise ValueError("No data arrays found in the file.")
 
     return datasets, final_identifiers, [date_range] if date_range else ['']
 
 
-def load_daily_distances(file_path, valid_identifiers):
-    with open(file_path, 'r', encoding='utf-8') as file:
-        content = file.read()
-
-    soup = BeautifulSoup(content, 'html.parser')
-    all_daily_distances = []
-    all_daily_dates = []
-    found_identifiers = []
+@timed('load_distances')
+def load_daily_distances(file_path, valid_identifiers, registry=None):
+    """
+    Daily distances and dates of every identifier in valid_identifiers (in that order,
+    empty if the road report has no table for it), followed by the vehicles that are
+    only in the road report. A vehicle's table is used for all of its sensor series,
+    looked up in registry (rebuilt from the names if not given).
+    Returns (distances, identifiers, dates).
+    """
+    if registry is None:
+        registry = IdentifierRegistry.from_names(valid_identifiers)
+    distances_by_series = {}
     deleted_distances = []
     deleted_dates = []
     deleted_identifiers = []
 
-    object_rows = soup.find_all('td', string='Обьект:')
-    
-    for object_row in object_rows:
-        identifier = object_row.find_next_sibling('td').get_text(strip=True)
-        current_table = object_row.find_parent('table')
-        distance_table = current_table.find_next_sibling('table')
-        
-        if distance_table:
-            daily_distances = []
-            daily_dates = []
-            for row in distance_table.find_all('tr')[1:]:
-                cells = row.find_all('td')
-                if len(cells) >= 2:
-                    date = datetime.strptime(cells[0].get_text(strip=True), '%Y-%m-%d').date()
-                    distance = cells[1].get_text(strip=True)
-                    distance_val = float(distance.replace(' km', ''))
-                    daily_distances.append(distance_val)
-                    daily_dates.append(date)
-            
-            # Modified: Check for base identifier (without " 1" or " 2" suffix)
-            base_identifier_found = False
-            for valid_id in valid_identifiers:
-                # Strip any " 1" or " 2" suffix for comparison
-                base_valid_id = valid_id.split(" ")[0] if " " in valid_id else valid_id
-                
-                if identifier == base_valid_id:
-                    base_identifier_found = True
-                    found_identifiers.append(identifier)
-                    all_daily_distances.append(daily_distances)
-                    all_daily_dates.append(daily_dates)
-                    break
-            
-            if not base_identifier_found:
-                deleted_identifiers.append(identifier)
-                deleted_distances.append(daily_distances)
-                deleted_dates.append(daily_dates)
-
-    # Modified: Map the daily distances to both identifier variations (with " 1" and " 2" suffixes)
-    ordered_distances = []
-    ordered_dates = []
-    
-    for valid_id in valid_identifiers:
-        # Check if this is a derived identifier (with " 1" or " 2" suffix)
-        base_id = valid_id.split(" ")[0] if " " in valid_id else valid_id
-        
-        # Find the base identifier in found_identifiers
-        if base_id in found_identifiers:
-            idx = found_identifiers.index(base_id)
-            ordered_distances.append(all_daily_distances[idx])
-            ordered_dates.append(all_daily_dates[idx])
+    # Each object table is followed by its distance table
+    identifier = None
+    for event in scan_report(file_path):
+        if event[0] == 'object':
+            identifier = event[1]
+            continue
+        if event[0] != 'distances' or identifier is None:
+            continue
+
+        daily_distances = []
+        daily_dates = []
+        for cells in event[1][1:]:
+            if len(cells) >= 2:
+                date = datetime.strptime(cells[0], '%Y-%m-%d').date()
+                distance = cells[1]
+                distance_val = float(distance.replace(' km', ''))
+                daily_distances.append(distance_val)
+                daily_dates.append(date)
+
+        series_names = registry.series_of(identifier)
+        if series_names:
+            # The first table of a vehicle wins
+            for name in series_names:
+                distances_by_series.setdefault(name, (daily_distances, daily_dates))
         else:
-            # If we can't find the base identifier, check for exact match
-            if valid_id in found_identifiers:
-                idx = found_identifiers.index(valid_id)
-                ordered_distances.append(all_daily_distances[idx])
-                ordered_dates.append(all_daily_dates[idx])
-
-    final_distances = ordered_distances + deleted_distances
-    final_dates = ordered_dates + deleted_dates
+            deleted_identifiers.append(identifier)
+            deleted_distances.append(daily_distances)
+            deleted_dates.append(daily_dates)
+        identifier = None
+
+    ordered = [distances_by_series.get(valid_id, ([], [])) for valid_id in valid_identifiers]
+    final_distances = [distances for distances, _ in ordered] + deleted_distances
+    final_dates = [dates for _, dates in ordered] + deleted_dates
     final_identifiers = valid_identifiers + deleted_identifiers
 
     return final_distances, final_identifiers, final_dates
@@ -327,121 +410,122 @@ def load_daily_distances(file_path, valid_identifiers):
 
 
 
-def detect_refills(data, threshold_percentage=5, time_window_minutes=60):
+class _SlidingExtreme:
+    """
+    Maximum (or minimum) of values[lo..hi] for windows whose bounds only move
+    forward, kept in a monotonic deque: amortized O(1) per query.
+    """
+
+    def __init__(self, values, maximum=True):
+        self.values = values
+        self.maximum = maximum
+        self.window = deque()
+        self.next_idx = 0
+
+    def query(self, lo, hi):
+        """Extreme of values[lo..hi] inclusive, None for an empty window"""
+        values, window = self.values, self.window
+        while self.next_idx <= hi:
+            value = values[self.next_idx]
+            if self.maximum:
+                while window and values[window[-1]] <= value:
+                    window.pop()
+            else:
+                while window and values[window[-1]] >= value:
+                    window.pop()
+            window.append(self.next_idx)
+            self.next_idx += 1
+        while window and window[0] < lo:
+            window.popleft()
+        if lo > hi or not window:
+            return None
+        return values[window[0]]
+
+
+# Refill detection defaults: minimum rise in percent and the look-ahead window
+REFILL_THRESHOLD_PERCENTAGE = 5
+REFILL_WINDOW_MINUTES = 60
+
+
+@timed('detect_refills')
+def detect_refills(data, threshold_percentage=REFILL_THRESHOLD_PERCENTAGE, time_window_minutes=REFILL_WINDOW_MINUTES):
+    """
+    Detect refills in (timestamp_ms, fuel) points sorted by timestamp, as returned by parse_data.
+    Works on integer millisecond timestamps: look-back/look-ahead windows are found by
+    binary search and their max/min come from sliding-window structures.
+    """
     refills = []
     in_refill = False
     min_fuel = None
     max_fuel = None
-    start_time = None
+    start_ms = None
+    last_ms = None
+    refill_start_ms = None
     last_valid_fuel = None  # To store the last fuel value greater than 3
 
-    def check_previous_fuel_levels(data, current_index, start_time, max_fuel):
-        """Check if there's a higher fuel level in the previous 120 minutes"""
-        check_start_time = start_time - timedelta(minutes=120)
-        comparison_fuel = max_fuel - 5
-        check_end_time = start_time
-        for j in range(current_index - 1, -1, -1):
-            check_time = datetime.utcfromtimestamp(data[j][0]/1000)
-            if check_time < check_start_time:
-                break
-            if check_time > check_end_time:
-                continue
-            if data[j][1] > comparison_fuel:
-                return True
-        return False
-    
-    def find_real_start_time(data, start_idx, start_fuel):
-        """Find the actual start time by skipping over periods of constant fuel level"""
-        real_start_idx = start_idx
-        current_fuel = start_fuel
-        
-        for i in range(start_idx + 1, len(data)):
-            if data[i][1] > current_fuel:
-                real_start_idx = i - 1
-                break
-            if data[i][1] < current_fuel:
-                break
-        
-        return datetime.utcfromtimestamp(data[real_start_idx][0]/1000)
-    
-    def check_data_exists_in_window(data, check_time, current_index):
-        
-        # if current_index < 0 or current_index >= len(data):
-        #     return False, False, False
-            
-        current_time = check_time
-        
-        # Define window boundaries
-        time_5min_before = current_time - timedelta(minutes=10)
-        time_30sec_after = time_5min_before + timedelta(seconds=30)
-        time_30sec_before = time_5min_before - timedelta(seconds=30)
-        
-        exists_before_5min = False
-        
-        # Check if any data exists before the 5-minute boundary
-        for j in range(current_index - 1, -1, -1):
-            check_time = datetime.utcfromtimestamp(data[j][0]/1000)
-            if time_30sec_before < check_time < time_30sec_after:
-                exists_before_5min = True
-                break
-            if check_time < time_5min_before:
-                break
-        
-       
-        
-        return exists_before_5min
-        
-    for i in range(1, len(data)):
-        prev_fuel = data[i-1][1]
-        current_fuel = data[i][1]
-        current_time = datetime.utcfromtimestamp(data[i][0]/1000)
-
-        if current_fuel == None:
-            current_fuel = 0
-        if prev_fuel == None:
-            prev_fuel = 0
-        
+    n = len(data)
+    times = [int(round(point[0])) for point in data]
+    fuel = [point[1] if point[1] is not None else 0 for point in data]
+    window_ms = time_window_minutes * 60000
+
+    # Index of the next point whose fuel level differs from point j
+    next_change = [n] * n
+    for j in range(n - 2, -1, -1):
+        next_change[j] = j + 1 if fuel[j + 1] != fuel[j] else next_change[j + 1]
+
+    # Max fuel in the 120 minutes before a refill, min fuel in the window after it
+    previous_max = _SlidingExtreme(fuel, maximum=True)
+    following_min = _SlidingExtreme(fuel, maximum=False)
+
+    for i in range(1, n):
+        prev_fuel = fuel[i-1]
+        current_fuel = fuel[i]
+
         if current_fuel >= 1:
             last_valid_fuel = current_fuel
-        
+
         if current_fuel >= prev_fuel:
             if not in_refill:
-                # Start a refill only if there's data before our window
-                start_time = find_real_start_time(data, i-1, prev_fuel)
-                if check_data_exists_in_window(data, start_time, i-1):
+                # Find the actual start by skipping over a period of constant fuel level
+                k = next_change[i-1]
+                real_start_idx = k - 1 if k < n and fuel[k] > prev_fuel else i - 1
+                candidate_ms = times[real_start_idx]
+
+                # Start a refill only if there's data around 10 minutes before it
+                check_ms = candidate_ms - 600000
+                j = bisect_left(times, check_ms + 30000, 0, i - 1) - 1
+                if j >= 0 and times[j] > check_ms - 30000:
                     in_refill = True
                     min_fuel = prev_fuel if prev_fuel >= 1 else last_valid_fuel
-                    start_time = find_real_start_time(data, i-1, prev_fuel)
+                    start_ms = candidate_ms
+                    start_time = datetime.utcfromtimestamp(data[real_start_idx][0]/1000)
             if in_refill:
                 max_fuel = current_fuel
-                last_time = current_time
+                last_ms = times[i]
         elif in_refill:
             in_refill = False
             if min_fuel is not None and max_fuel is not None:
                 if min_fuel <= 0 and last_valid_fuel is not None:
                     min_fuel = last_valid_fuel
-                
+
                 percent_change = max_fuel - min_fuel
                 if min_fuel >= 0:
                     if percent_change > threshold_percentage:
-                        valid_refill = True
-                        end_time = last_time + timedelta(minutes=time_window_minutes)
-                        
-                        if check_previous_fuel_levels(data, i, start_time, max_fuel):
-                            valid_refill = False
-                        else:
-                            # Check for significant drops after the refill
-                            for j in range(i, len(data)):
-                                check_time = datetime.utcfromtimestamp(data[j][0]/1000)
-                                if check_time > end_time:
-                                    break
-                                # Only invalidate if we see a significant drop
-                                if data[j][1] <= min_fuel + (percent_change * 0.7):  # Allow for some normal usage drop
-                                    valid_refill = False
-                                    break
-                        
+                        # Invalid if there's a higher fuel level in the previous 120 minutes
+                        lo = bisect_left(times, start_ms - 7200000, 0, i)
+                        hi = bisect_right(times, start_ms, 0, i) - 1
+                        earlier = previous_max.query(lo, hi)
+                        valid_refill = earlier is None or earlier <= max_fuel - 5
+
+                        if valid_refill:
+                            # Only invalidate if we see a significant drop after the refill
+                            hi = bisect_right(times, last_ms + window_ms) - 1
+                            lowest = following_min.query(i, hi)
+                            if lowest is not None and lowest <= min_fuel + (percent_change * 0.7):  # Allow for some normal usage drop
+                                valid_refill = False
+
                         if valid_refill:
-                            if refills and (last_time - refills[-1]['timestamp']) <= timedelta(minutes=time_window_minutes):
+                            if refills and last_ms - refill_start_ms <= window_ms:
                                 refills[-1]['max_fuel'] = max(refills[-1]['max_fuel'], max_fuel)
                                 refills[-1]['percent_change'] = refills[-1]['max_fuel'] - refills[-1]['min_fuel']
                             else:
@@ -451,15 +535,241 @@ def detect_refills(data, threshold_percentage=5, time_window_minutes=60):
                                     'max_fuel': max_fuel,
                                     'min_fuel': min_fuel
                                 })
+                                refill_start_ms = start_ms
             min_fuel, max_fuel = None, None
-    
+
     return refills
+
+
+class RefillDetector:
+    """
+    Streaming detect_refills: feed (timestamp_ms, fuel) points sorted by timestamp with
+    push() or extend(), which return the refills confirmed so far. A refill is confirmed
+    once its look-ahead window has closed and no later refill can be merged into it;
+    finish() ends the series and returns the rest. The same points give the same refills
+    as detect_refills.
+
+    Only the points the rules can still look at are buffered: 120 minutes before the
+    newest point (or the open refill) and the look-ahead of ended refills. A stretch of
+    constant fuel is followed until the level changes (it decides where a refill starts),
+    but only its first point and its newest 120 minutes are kept: the points between
+    them have the same level and are no longer near enough to be looked at.
+    state() and from_state() carry a detector over to the next export.
+    """
+
+    _STATE = ('threshold_percentage', 'time_window_minutes', 'offset', 'raw_times', 'times', 'fuel',
+              'position', 'finished', 'in_refill', 'min_fuel', 'max_fuel', 'start_ms', 'start_raw',
+              'last_ms', 'last_valid_fuel', 'last_refill', 'refill_start_ms')
+
+    def __init__(self, threshold_percentage=REFILL_THRESHOLD_PERCENTAGE, time_window_minutes=REFILL_WINDOW_MINUTES):
+        self.threshold_percentage = threshold_percentage
+        self.time_window_minutes = time_window_minutes
+
+        # Buffered points, offset is the index of the first one in the whole series
+        # (counted without the middle of collapsed constant stretches)
+        self.offset = 0
+        self.raw_times = []
+        self.times = []
+        self.fuel = []
+        self.changes = deque()  # Indices of points whose fuel differs from the point before
+        self.position = 1  # Next point of the detection loop
+        self.finished = False
+
+        # Refill being followed by the detection loop
+        self.in_refill = False
+        self.min_fuel = None
+        self.max_fuel = None
+        self.start_ms = None
+        self.start_raw = None
+        self.last_ms = None
+        self.last_valid_fuel = None
+
+        self.ended = deque()  # Ended refills waiting for their look-ahead window to close
+        self.last_refill = None  # Newest accepted refill, later ones may still merge into it
+        self.refill_start_ms = None
+
+    def state(self):
+        """JSON-serializable state, restored with RefillDetector.from_state"""
+        state = {name: getattr(self, name) for name in self._STATE}
+        state['changes'] = list(self.changes)
+        state['ended'] = list(self.ended)
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        detector = cls(state['threshold_percentage'], state['time_window_minutes'])
+        for name in cls._STATE:
+            setattr(detector, name, state[name])
+        detector.changes = deque(state['changes'])
+        detector.ended = deque(state['ended'])
+        return detector
+
+    def push(self, timestamp, fuel):
+        return self.extend(((timestamp, fuel),))
+
+    def extend(self, points):
+        if self.finished:
+            raise ValueError("RefillDetector is already finished")
+        for timestamp, fuel in points:
+            fuel = float(fuel) if fuel is not None else 0
+            if self.fuel and fuel != self.fuel[-1]:
+                self.changes.append(self.offset + len(self.fuel))
+            self.raw_times.append(float(timestamp))
+            self.times.append(int(round(timestamp)))
+            self.fuel.append(fuel)
+        return self._run()
+
+    def finish(self):
+        self.finished = True
+        confirmed = self._run()
+        if self.last_refill is not None:
+            confirmed.append(self._refill(self.last_refill))
+            self.last_refill = None
+        return confirmed
+
+    def _run(self):
+        confirmed = []
+        n = self.offset + len(self.times)
+        while self.position < n:
+            i = self.position
+            while self.changes and self.changes[0] < i:
+                self.changes.popleft()
+            # Where the fuel level changes next, unknown until a later point differs
+            if self.changes:
+                next_change = self.changes[0]
+            elif self.finished:
+                next_change = n
+            else:
+                break
+            self._step(i, next_change, n)
+            self.position += 1
+
+        self._resolve(confirmed)
+        self._trim()
+        return confirmed
+
+    def _step(self, i, next_change, n):
+        # One iteration of the detect_refills loop, indices are into the whole series
+        offset, times, fuel = self.offset, self.times, self.fuel
+        prev_fuel = fuel[i - 1 - offset]
+        current_fuel = fuel[i - offset]
+
+        if current_fuel >= 1:
+            self.last_valid_fuel = current_fuel
+
+        if current_fuel >= prev_fuel:
+            if not self.in_refill:
+                k = next_change
+                real_start_idx = k - 1 if k < n and fuel[k - offset] > prev_fuel else i - 1
+                candidate_ms = times[real_start_idx - offset]
+
+                check_ms = candidate_ms - 600000
+                j = bisect_left(times, check_ms + 30000, 0, i - 1 - offset) - 1
+                if j >= 0 and times[j] > check_ms - 30000:
+                    self.in_refill = True
+                    self.min_fuel = prev_fuel if prev_fuel >= 1 else self.last_valid_fuel
+                    self.start_ms = candidate_ms
+                    self.start_raw = self.raw_times[real_start_idx - offset]
+            if self.in_refill:
+                self.max_fuel = current_fuel
+                self.last_ms = times[i - offset]
+        elif self.in_refill:
+            self.in_refill = False
+            if self.min_fuel is not None and self.max_fuel is not None:
+                if self.min_fuel <= 0 and self.last_valid_fuel is not None:
+                    self.min_fuel = self.last_valid_fuel
+
+                percent_change = self.max_fuel - self.min_fuel
+                if self.min_fuel >= 0 and percent_change > self.threshold_percentage:
+                    lo = bisect_left(times, self.start_ms - 7200000, 0, i - offset)
+                    hi = bisect_right(times, self.start_ms, 0, i - offset) - 1
+                    earlier = max(fuel[lo:hi + 1]) if lo <= hi else None
+                    if earlier is None or earlier <= self.max_fuel - 5:
+                        # The drop after the refill is checked once its window has been seen
+                        self.ended.append({
+                            'index': i,
+                            'deadline': self.last_ms + self.time_window_minutes * 60000,
+                            'start_ms': self.start_ms,
+                            'start_raw': self.start_raw,
+                            'last_ms': self.last_ms,
+                            'percent_change': percent_change,
+                            'max_fuel': self.max_fuel,
+                            'min_fuel': self.min_fuel,
+                        })
+            self.min_fuel, self.max_fuel = None, None
+
+    def _resolve(self, confirmed):
+        window_ms = self.time_window_minutes * 60000
+        while self.ended and (self.finished or self.times[-1] > self.ended[0]['deadline']):
+            refill = self.ended.popleft()
+            lo = refill['index'] - self.offset
+            hi = bisect_right(self.times, refill['deadline']) - 1
+            lowest = min(self.fuel[lo:hi + 1]) if lo <= hi else None
+            if lowest is not None and lowest <= refill['min_fuel'] + (refill['percent_change'] * 0.7):
+                continue
+
+            if self.last_refill is not None and refill['last_ms'] - self.refill_start_ms <= window_ms:
+                self.last_refill['max_fuel'] = max(self.last_refill['max_fuel'], refill['max_fuel'])
+                self.last_refill['percent_change'] = self.last_refill['max_fuel'] - self.last_refill['min_fuel']
+            else:
+                if self.last_refill is not None:
+                    confirmed.append(self._refill(self.last_refill))
+                self.last_refill = {key: refill[key] for key in ('start_raw', 'percent_change', 'max_fuel', 'min_fuel')}
+                self.refill_start_ms = refill['start_ms']
+
+        # Nothing after the merge window can be merged into the newest refill anymore
+        if self.last_refill is not None and self.position <= self.offset + len(self.times):
+            merge_until = self.refill_start_ms + window_ms
+            if (self.times[self.position - 1 - self.offset] > merge_until
+                    and (not self.ended or self.ended[0]['last_ms'] > merge_until)):
+                confirmed.append(self._refill(self.last_refill))
+                self.last_refill = None
+
+    def _trim(self):
+        if not self.times:
+            return
+        keep = self.position - 1
+        if self.ended:
+            keep = min(keep, self.ended[0]['index'])
+        reference = self.times[self.position - 1 - self.offset]
+        if self.in_refill:
+            reference = min(reference, self.start_ms)
+        keep = min(keep, self.offset + bisect_left(self.times, reference - 7200000))
+
+        # Drop in bulk so trimming stays amortized O(1) per point
+        drop = keep - self.offset
+        if drop > len(self.times) // 2:
+            del self.raw_times[:drop], self.times[:drop], self.fuel[:drop]
+            self.offset = keep
+
+        # Waiting for the level of a constant stretch to change: no index after its first
+        # point (position - 1) is stored anywhere, so the middle of it can be cut out.
+        # A refill starting at its end looks 10 minutes back for data and 120 minutes
+        # back for a higher level; inside the stretch every level is the same.
+        if not self.changes and not self.finished:
+            first = self.position - self.offset
+            last = bisect_left(self.times, self.times[-1] - 7200000)
+            if last - first > len(self.times) // 2:
+                del self.raw_times[first:last], self.times[first:last], self.fuel[first:last]
+
+    @staticmethod
+    def _refill(refill):
+        return {
+            'timestamp': datetime.utcfromtimestamp(refill['start_raw']/1000),
+            'percent_change': refill['percent_change'],
+            'max_fuel': refill['max_fuel'],
+            'min_fuel': refill['min_fuel'],
+        }
+
+
 def analyze_fuel_data(data_pair):
     """
-    Analyze fuel data with engine status filtering
+    Analyze fuel data with engine status filtering.
+    Accepts a ParsedSeries or a raw (fuel, engine) data pair.
     """
-    raw_data, engine_data = data_pair
-    data = parse_data(raw_data, engine_data)
+    if not isinstance(data_pair, ParsedSeries):
+        data_pair = ParsedSeries(*data_pair)
+    data = data_pair.data
     
     if not data:
         return [], {'num_refills': 0, 'first_fuel': None, 'last_fuel': None}
@@ -476,232 +786,319 @@ def analyze_fuel_data(data_pair):
     
     return refills, stats
 
+def _analyze_arrays(arrays):
+    """Process pool worker: analyze one parsed (timestamps, fuel) series"""
+    return analyze_fuel_data(ParsedSeries.from_arrays(*arrays))
+
+
+@timed('analyze')
+def analyze_datasets(datasets, workers=1):
+    """
+    Run analyze_fuel_data over every ParsedSeries, in parallel over a process pool
+    when workers > 1 (None uses one worker per CPU). Results keep the input order.
+    """
+    if (workers is None or workers > 1) and len(datasets) > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                # Only the parsed arrays are sent to the workers, not the raw strings
+                arrays = [(series.timestamps, series.fuel) for series in datasets]
+                chunksize = max(1, len(arrays) // ((workers or os.cpu_count() or 1) * 4))
+                return list(pool.map(_analyze_arrays, arrays, chunksize=chunksize))
+        except (OSError, NotImplementedError, BrokenProcessPool) as e:
+            print(f"Warning: Parallel analysis failed, falling back to serial: {str(e)}")
+
+    return [analyze_fuel_data(series) for series in datasets]
+
+def daily_fuel_levels(data):
+    """
+    First and last fuel level of each UTC day in (timestamp_ms, fuel) points, in data order.
+    Timestamps are bucketed into day indices in one vectorized pass.
+    """
+    if not data:
+        return {}
+    timestamps = np.array([point[0] for point in data], dtype=np.float64)
+    days = np.floor_divide(timestamps, 86400000).astype(np.int64)
+    unique_days, first_idx = np.unique(days, return_index=True)
+    _, last_from_end = np.unique(days[::-1], return_index=True)
+    last_idx = len(days) - 1 - last_from_end
+
+    epoch = datetime(1970, 1, 1).date()
+    levels = {}
+    for day, first, last in zip(unique_days.tolist(), first_idx.tolist(), last_idx.tolist()):
+        start_fuel = data[first][1]
+        end_fuel = data[last][1]
+        levels[epoch + timedelta(days=day)] = (
+            float(start_fuel if start_fuel is not None else 0),
+            float(end_fuel if end_fuel is not None else 0),
+        )
+    return levels
+
+@timed('build_report')
+def build_report(datasets, identifiers, all_daily_distances, all_daily_dates):
+    """
+    Compute the report once for every dataset: a VehicleReport with the vehicle summary,
+    its refills and daily rows
+    """
+    reports = []
+
+    # Process multiple datasets
+    for idx, (refills, stats, data) in enumerate(datasets):
+        dataset_name = identifiers[idx]
+        refill_rows = []
+        total_refill = 0.0  # Initialize as float
+        total_consumption = 0.0  # Initialize as float
+
+        # Safely handle None values for first and last fuel readings
+        first = float(stats['first_fuel'] if stats['first_fuel'] is not None else 0)
+        last = float(stats['last_fuel'] if stats['last_fuel'] is not None else 0)
+        daily_distances = all_daily_distances[idx] if idx < len(all_daily_distances) else []
+
+        # Create a dictionary to store refill dates for daily counting
+        refill_dates = {}
+        for refill in refills:
+            refill_date = refill['timestamp'].date()
+            refill_dates[refill_date] = refill_dates.get(refill_date, 0) + 1
+
+        for refill in refills:
+            # Safely handle None values in refill calculations
+            min_fuel = float(refill.get('min_fuel', 0) or 0)  # Convert None to 0
+            max_fuel = float(refill.get('max_fuel', 0) or 0)  # Convert None to 0
+
+            consumption = round(first - min_fuel, 2)
+            percent_change = max_fuel - min_fuel
+
+            total_refill += percent_change
+            total_consumption += consumption
+            refill_rows.append(Refill(refill['timestamp'], min_fuel, max_fuel, percent_change, consumption))
+
+            first = max_fuel
+
+        # Safely calculate final consumption
+        total_consumption += first - last
+
+        # Consumption per 100 km is based on the reported (rounded, non-negative) consumption
+        reported_consumption = round(float(total_consumption), 2) if total_consumption > 0 else 0
+        total_distance = sum(daily_distances) if daily_distances else None
+        avg_consumption = reported_consumption / total_distance * 100 if total_distance else None
+
+        # Check for urgent cases
+        urgent = stats.get('first_fuel', 0) == 0 and stats.get('last_fuel', 0) == 0
+
+        # Check for multiple refills in 24 hours
+        burst = find_refill_burst([refill['timestamp'] for refill in refills])
+        if burst:
+            # The window is in the summary tables, the run report only counts the vehicles
+            urgent = True
+            count('refill_bursts')
+
+        summary = VehicleSummary(
+            name=dataset_name,
+            urgent=urgent,
+            urgent_window=burst,
+            total_distance=total_distance,
+            refill_total=float(total_refill),
+            refill_count=int(stats.get('num_refills', 0)),
+            consumption=reported_consumption,
+            avg_consumption=avg_consumption,
+            first_fuel=float(stats.get('first_fuel', 0) or 0),
+            last_fuel=float(stats.get('last_fuel', 0) or 0),
+        )
+
+        # Process daily data
+        daily_rows = []
+        daily_dates = all_daily_dates[idx] if idx < len(all_daily_dates) else []
+        daily_start_fuel = 0.0
+        daily_end_fuel = 0.0
+
+        # Bucket fuel levels and refill amounts by day once instead of rescanning per date
+        day_fuel_levels = daily_fuel_levels(data)
+        daily_refill_totals = {}
+        for refill in refills:
+            refill_date = refill['timestamp'].date()
+            daily_refill_totals[refill_date] = daily_refill_totals.get(refill_date, 0.0) + float(refill.get('percent_change', 0) or 0)
+
+        for date_idx, current_date in enumerate(daily_dates):
+            # Get start and end fuel levels for the day
+            if current_date in day_fuel_levels:
+                daily_start_fuel, daily_end_fuel = day_fuel_levels[current_date]
+
+            # Calculate total daily refill amount
+            total_daily_refill = daily_refill_totals.get(current_date, 0.0)
+
+            daily_consumption = daily_start_fuel + total_daily_refill - daily_end_fuel
+            daily_distance = float(daily_distances[date_idx] if date_idx < len(daily_distances) else 0)
+
+            # Calculate average consumption per 100km
+            daily_rows.append(DailyRow(
+                date=current_date,
+                distance=daily_distance,
+                refill_amount=total_daily_refill,
+                refill_count=refill_dates.get(current_date, 0),
+                start_fuel=daily_start_fuel,
+                end_fuel=daily_end_fuel,
+                consumption=daily_consumption,
+                avg_consumption=daily_consumption / daily_distance * 100 if daily_distance > 0 else None,
+            ))
+
+        reports.append(VehicleReport(summary, refill_rows, daily_rows))
+
+    return reports
+
+
+SUMMARY_COLUMNS = ['Обьект', 'Нийт явсан км', 'Түлш дүүрлт /Л/', 'Түлш дүүргэсэн тоо', 'Түлш зарцуулалт /Л/',
+                   'Дундаж хэрэглээ/100км/', 'Эхний үлдэгдэл', 'Эцсийн үлдэгдэл', 'Яаралтай хугацаа']
+REFILL_COLUMNS = [' ', 'Эхэлсэн хугацаа', 'Өмнөх түлш', 'Дараах түлш', 'Нэмсэн түлш',
+                  'Сүүлд дүүргэснээс хойш зарцуулалт']
+DAILY_COLUMNS = ['', 'Нийт явсан км', 'Түлш дүүрлт /Л/', 'Түлш дүүргэсэн тоо', 'Түлш зарцуулалт /Л/',
+                 'Дундаж хэрэглээ/100км/', 'Эхний үлдэгдэл', 'Эцсийн үлдэгдэл']
+
+
+def _summary_values(summary):
+    return [
+        summary.name + (" (яаралтай шалгуулах хэрэгтэй)" if summary.urgent else ""),
+        summary.total_distance if summary.total_distance is not None else 'N/A',
+        round(summary.refill_total, 2),
+        summary.refill_count,
+        round(summary.consumption, 2),
+        round(summary.avg_consumption, 2) if summary.avg_consumption is not None else 'N/A',
+        round(summary.first_fuel, 2),
+        round(summary.last_fuel, 2),
+        _urgent_window_text(summary.urgent_window),
+    ]
+
+
+def _urgent_window_text(window):
+    if not window:
+        return ""
+    start, end, refills = window
+    return f"{start:%Y-%m-%d %H:%M} - {end:%Y-%m-%d %H:%M}: {refills} дүүргэлт"
+
+
+def _refill_values(refill):
+    return [
+        " ",
+        refill.timestamp,
+        round(refill.min_fuel, 2),
+        round(refill.max_fuel, 2),
+        round(refill.added, 2),
+        round(refill.consumption, 2),
+    ]
+
+
+def _daily_values(day):
+    return [
+        day.date,
+        round(day.distance, 2),
+        round(day.refill_amount, 2),
+        day.refill_count,
+        round(day.consumption, 2) if day.consumption > 0 else 0,
+        round(day.avg_consumption, 2) if day.avg_consumption is not None and day.avg_consumption > 0 else " ",
+        round(day.start_fuel, 2),
+        round(day.end_fuel, 2),
+    ]
+
+
+@timed('export_excel')
+def write_excel_report(reports, date_ranges, output_file):
+    """
+    Render the VehicleReports from build_report into a streamed Excel workbook
+    """
+    # openpyxl is only imported when an Excel report is written, table output and
+    # callers that only parse or analyze start faster without it
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.utils import get_column_letter
+    from openpyxl.styles import Border, Side, Alignment, Font, PatternFill
+
+    # Lay out all rows first: the write-only worksheet needs column widths and
+    # row groups before it starts streaming rows, so widths are tracked per row
+    header_fill = PatternFill(start_color="B8CCE4", end_color="B8CCE4", fill_type="solid")
+    urgent_fill = PatternFill(start_color="FFCCCB", end_color="FFCCCB", fill_type="solid")  # Light red background
+    normal_fill = PatternFill(start_color="D8E4BC", end_color="D8E4BC", fill_type="solid")
+    table_fill = PatternFill(start_color="E4DFEC", end_color="E4DFEC", fill_type="solid")
+    table_header_fills = {col: table_fill for col in range(2, 9)}
+
+    rows = []
+    grouped_rows = []
+    column_widths = []
+    shortest_row = None
+
+    def add_row(values, fills=None):
+        nonlocal shortest_row
+        rows.append((values, fills or {}))
+        for col, value in enumerate(values):
+            if col == len(column_widths):
+                column_widths.append(0)
+            column_widths[col] = max(column_widths[col], len(str(value)))
+        shortest_row = len(values) if shortest_row is None else min(shortest_row, len(values))
+
+    add_row([f"Хугацаа: {date_ranges[0]}"])
+
+    # Write summary data
+    add_row(list(SUMMARY_COLUMNS) if reports else [])
+
+    # Add datasets to the Excel file
+    for report in reports:
+        # Write summary for each dataset
+        add_row(_summary_values(report.summary), {1: urgent_fill if report.summary.urgent else normal_fill})
+        rows[1][1].update({col: header_fill for col in range(1, len(SUMMARY_COLUMNS) + 1)})
+
+        # Write refills data
+        add_row(list(REFILL_COLUMNS) if report.refills else [], table_header_fills)
+        for refill in report.refills:
+            add_row(_refill_values(refill))
+
+        # Write daily data, grouped and collapsed under the summary row
+        if report.daily:
+            grouped_rows.extend(range(len(rows) + 1, len(rows) + len(report.daily) + 2))
+        add_row(list(DAILY_COLUMNS) if report.daily else [], table_header_fills)
+        for day in report.daily:
+            add_row(_daily_values(day))
+
+    # Every cell of the used range is written, empty ones show as 'None' in the width
+    max_column = max([len(column_widths)] + [max(fills) for _, fills in rows if fills])
+    column_widths.extend([0] * (max_column - len(column_widths)))
+    for col in range(shortest_row, max_column):
+        column_widths[col] = max(column_widths[col], len('None'))
+
+    # Stream the rows with shared style objects
+    thin_border = Border(left=Side(style='thin'),
+                         right=Side(style='thin'),
+                         top=Side(style='thin'),
+                         bottom=Side(style='thin'))
+    alignment = Alignment(wrap_text=True, vertical='center', horizontal='center')
+    bold_font = Font(bold=True)
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet('Ерөнхий мэдээлэл')
+    for col, max_length in enumerate(column_widths, 1):
+        worksheet.column_dimensions[get_column_letter(col)].width = max_length + 2
+    for row_idx in grouped_rows:
+        worksheet.row_dimensions[row_idx].outline_level = 1
+        worksheet.row_dimensions[row_idx].hidden = True
+
+    for row_idx, (values, fills) in enumerate(rows, 1):
+        cells = []
+        for col in range(1, max_column + 1):
+            cell = WriteOnlyCell(worksheet, value=values[col - 1] if col <= len(values) else None)
+            cell.border = thin_border
+            cell.alignment = alignment
+            if col in fills:
+                cell.fill = fills[col]
+            cells.append(cell)
+        if row_idx == 1:
+            cells[0].font = bold_font
+        worksheet.append(cells)
+
+    # Save the workbook
+    workbook.save(output_file)
+    count('rows_written', len(rows))
+
+
 def export_to_excel(datasets, identifiers, date_ranges, all_daily_distances, all_daily_dates, output_file='fuel_analysis.xlsx'):
     try:
-        all_summary_data = []
-        all_refills_data = []
-        all_daily_data = []
-        urgent_check_needed = []
-        
-        # Process multiple datasets
-        for idx, (refills, stats, data) in enumerate(datasets):
-            dataset_name = identifiers[idx] 
-            refills_data = []
-            total_refill = 0.0  # Initialize as float
-            total_consumption = 0.0  # Initialize as float
-            
-            # Safely handle None values for first and last fuel readings
-            first = float(stats['first_fuel'] if stats['first_fuel'] is not None else 0)
-            last = float(stats['last_fuel'] if stats['last_fuel'] is not None else 0)
-            daily_distances = all_daily_distances[idx] if idx < len(all_daily_distances) else []
-
-            # Create a dictionary to store refill dates for daily counting
-            refill_dates = {}
-            for refill in refills:
-                refill_date = refill['timestamp'].date()
-                refill_dates[refill_date] = refill_dates.get(refill_date, 0) + 1
-            
-            for i, refill in enumerate(refills, 1):
-                # Safely handle None values in refill calculations
-                min_fuel = float(refill.get('min_fuel', 0) or 0)  # Convert None to 0
-                max_fuel = float(refill.get('max_fuel', 0) or 0)  # Convert None to 0
-                
-                consumption = round(first - min_fuel, 2)
-                percent_change = max_fuel - min_fuel
-                
-                total_refill += percent_change
-                total_consumption += consumption
-
-                refills_data.append({
-                    ' ': " ",
-                    'Эхэлсэн хугацаа': refill['timestamp'],
-                    'Өмнөх түлш': round(min_fuel, 2),
-                    'Дараах түлш': round(max_fuel, 2),
-                    'Нэмсэн түлш': round(percent_change, 2),
-                    'Сүүлд дүүргэснээс хойш зарцуулалт': round(consumption, 2)
-                })
-
-                first = max_fuel
-
-            # Safely calculate final consumption
-            final_consumption = first - last if first is not None and last is not None else 0
-            total_consumption += final_consumption
-
-            # Calculate distance per refill safely
-            total_distance = sum(daily_distances) if daily_distances else 0
-            avg_consumption = (total_consumption / total_distance * 100) if total_distance > 0 else 0
-
-            # Create summary data with safe handling of None values
-            summary_data = {
-                'Обьект': dataset_name + (" (яаралтай шалгуулах хэрэгтэй)" if idx in urgent_check_needed else ""),
-                'Нийт явсан км': total_distance if total_distance != 0 else 'N/A',
-                'Түлш дүүрлт /Л/': round(float(total_refill), 2),
-                'Түлш дүүргэсэн тоо': int(stats.get('num_refills', 0)),
-                'Түлш зарцуулалт /Л/': round(float(total_consumption), 2) if total_consumption > 0 else 0,
-                'Дундаж хэрэглээ/100км/': round(avg_consumption, 2) if avg_consumption > 0 else "",
-                'Эхний үлдэгдэл': round(float(stats.get('first_fuel', 0) or 0), 2),
-                'Эцсийн үлдэгдэл': round(float(stats.get('last_fuel', 0) or 0), 2)
-            }
-            all_summary_data.append(summary_data)
-
-            # Check for urgent cases
-            if stats.get('first_fuel', 0) == 0 and stats.get('last_fuel', 0) == 0:
-                urgent_check_needed.append(idx)
-
-            # Check for multiple refills in 24 hours
-            refill_times = [refill['timestamp'] for refill in refills]
-            refill_times.sort()
-            for i in range(len(refill_times)):
-                end_time = refill_times[i]
-                start_time = end_time - timedelta(hours=24)
-                refills_in_24h = sum(1 for t in refill_times if start_time <= t <= end_time)
-                if refills_in_24h >= 5:
-                    urgent_check_needed.append(idx)
-                    break
-
-            # Process daily data
-            daily_data = []
-            daily_dates = all_daily_dates[idx] if idx < len(all_daily_dates) else []
-            daily_start_fuel = 0.0
-            daily_end_fuel = 0.0
-            
-            for date_idx, current_date in enumerate(daily_dates):
-                # Find fuel levels for this date
-                day_fuel_levels = []
-                total_daily_refill = 0.0
-                
-                for timestamp, fuel_level in data:
-                    data_date = datetime.utcfromtimestamp(timestamp / 1000).date()
-                    if data_date == current_date:
-                        day_fuel_levels.append(float(fuel_level if fuel_level is not None else 0))
-                        
-                # Get start and end fuel levels for the day
-                if day_fuel_levels:
-                    daily_start_fuel = day_fuel_levels[0]
-                    daily_end_fuel = day_fuel_levels[-1]
-                
-                # Calculate total daily refill amount
-                for refill in refills:
-                    if refill['timestamp'].date() == current_date:
-                        total_daily_refill += float(refill.get('percent_change', 0) or 0)
-                
-                daily_consumption = daily_start_fuel + total_daily_refill - daily_end_fuel
-                daily_distance = float(daily_distances[date_idx] if date_idx < len(daily_distances) else 0)
-                
-                # Calculate average consumption per 100km
-                avg_consumption = (daily_consumption / daily_distance * 100) if daily_distance > 0 else 0
-                
-                daily_data.append({
-                    '': current_date,
-                    'Нийт явсан км': round(daily_distance, 2),
-                    'Түлш дүүрлт /Л/': round(total_daily_refill, 2),
-                    'Түлш дүүргэсэн тоо': refill_dates.get(current_date, 0),
-                    'Түлш зарцуулалт /Л/': round(daily_consumption, 2) if daily_consumption > 0 else 0,
-                    'Дундаж хэрэглээ/100км/': round(avg_consumption, 2) if avg_consumption > 0 else " ",
-                    'Эхний үлдэгдэл': round(daily_start_fuel, 2),
-                    'Эцсийн үлдэгдэл': round(daily_end_fuel, 2),
-                })
-            
-            all_refills_data.append((dataset_name, refills_data))
-            all_daily_data.append((dataset_name, daily_data))
-
-        # Export all data to Excel
-        workbook = Workbook()
-        worksheet = workbook.active
-        worksheet.title = 'Ерөнхий мэдээлэл'
-        
-        date_range_cell = worksheet.cell(row=1, column=1, value=f"Хугацаа: {date_ranges[0]}")
-        date_range_cell.font = Font(bold=True)
-
-        # Write summary data
-        summary_df = pd.DataFrame(all_summary_data)
-        header_row = dataframe_to_rows(summary_df, index=False, header=True)
-        worksheet.append(next(header_row))
-        
-       
-        # Add datasets to the Excel file
-        for idx, (dataset_name, refills_data) in enumerate(all_refills_data):
-               # Write object name (identifier) and date range only once at the top
-            # Write summary for each dataset
-            daily_distances = all_daily_distances[idx] if idx < len(all_daily_distances) else []
-            summary_start_row = worksheet.max_row   # Leave a gap before the next dataset
-            total_distance = sum(daily_distances) if daily_distances else 0
-            total_refill = all_summary_data[idx]['Түлш зарцуулалт /Л/']
-
-    # Calculate distance per refill, handle division by zero if total_refill is 0
-            distance_per_refill = total_refill / total_distance if total_distance != 0 else 'N/A'
-            distance_per_refill = distance_per_refill * 100
-            summary_row = {
-                'Обьект': dataset_name + (" (яаралтай шалгуулах хэрэгтэй)" if idx in urgent_check_needed else ""),
-                'Нийт явсан км': sum(daily_distances) if daily_distances else 'N/A',
-                'Түлш дүүрлт /Л/': round(all_summary_data[idx]['Түлш дүүрлт /Л/'], 2),
-                'Түлш дүүргэсэн тоо': all_summary_data[idx]['Түлш дүүргэсэн тоо'],
-                'Түлш зарцуулалт /Л/': round(all_summary_data[idx]['Түлш зарцуулалт /Л/'], 2),
-                'Дундаж хэрэглээ/100км/': round(distance_per_refill, 2) if isinstance(distance_per_refill, (int, float)) else 'N/A',
-                'Эхний үлдэгдэл': round(all_summary_data[idx]['Эхний үлдэгдэл'], 2),
-                'Эцсийн үлдэгдэл': round(all_summary_data[idx]['Эцсийн үлдэгдэл'], 2)
-            }
-            worksheet.append([summary_row[key] for key in summary_row])
-            if idx in urgent_check_needed:
-                cell = worksheet.cell(row=worksheet.max_row, column=1)
-                cell.fill = PatternFill(start_color="FFCCCB", end_color="FFCCCB", fill_type="solid")  # Light red background
-            else:
-                cell = worksheet.cell(row=worksheet.max_row, column=1)
-                cell.fill = PatternFill(start_color="D8E4BC", end_color="D8E4BC", fill_type="solid")  
-            fill_color = PatternFill(start_color="B8CCE4", end_color="B8CCE4", fill_type="solid")
-            for col in range(1, 9):  # Adjust the range for the number of columns you want
-                cell = worksheet.cell(row=2, column=col)
-                cell.fill = fill_color
-            # Write refills data
-            refills_df = pd.DataFrame(refills_data)
-            daily_row = worksheet.max_row + 1
-            for r in dataframe_to_rows(refills_df, index=False, header=True):
-                worksheet.append(r)
-            fil_color = PatternFill(start_color="E4DFEC", end_color="E4DFEC", fill_type="solid")
-            for col in range(2, 9):  # Adjust the range for the number of columns you want
-                cell = worksheet.cell(row=daily_row, column=col)
-                cell.fill = fil_color
-
-            daily_df = pd.DataFrame(all_daily_data[idx][1])
-            daily_start_row = worksheet.max_row + 1
-            
-            for r in dataframe_to_rows(daily_df, index=False, header=True):
-                worksheet.append(r)
-            
-            # Get the starting and ending rows for daily data
-            daily_end_row = worksheet.max_row
-            worksheet.row_dimensions.group(daily_start_row , daily_end_row, outline_level=1, hidden=True)
-            for col in range(2, 9):  # Adjust the range for the number of columns you want
-                cell = worksheet.cell(row=daily_start_row, column=col)
-                cell.fill = fil_color
-            
-
-        # Apply formatting
-        thin_border = Border(left=Side(style='thin'),
-                             right=Side(style='thin'),
-                             top=Side(style='thin'),
-                             bottom=Side(style='thin'))
-        
-        # Apply border and alignment to all cells
-        for row in worksheet.iter_rows(min_row=1, max_row=worksheet.max_row, min_col=1, max_col=worksheet.max_column):
-            for cell in row:
-                cell.border = thin_border
-                cell.alignment = Alignment(wrap_text=True, vertical='center', horizontal='center')
-
-        # Adjust column widths
-        for column in worksheet.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    max_length = max(max_length, len(str(cell.value)))
-                except:
-                    pass
-            adjusted_width = (max_length + 2)
-            worksheet.column_dimensions[column_letter].width = adjusted_width
-
-        # Save the workbook
-        workbook.save(output_file)
+        reports = build_report(datasets, identifiers, all_daily_distances, all_daily_dates)
+        write_excel_report(reports, date_ranges, output_file)
 
         return output_file, len(datasets)
 
@@ -710,44 +1107,99 @@ def export_to_excel(datasets, identifiers, date_ranges, all_daily_distances, all
         return None, 0
 
 
-def main(file_path1, file_path2, engine_file=None):
+def store_series(store, datasets, identifiers):
+    """
+    Append the parsed fuel series (engine-on points, zeros filled) and the engine
+    readings of every vehicle to a SeriesStore
+    """
+    for series, identifier in zip(datasets, identifiers):
+        if series.is_valid:
+            store.append(identifier, 'fuel', series.timestamps, series.fuel)
+        if series.engine_data:
+            engine_ts, engine_values, sortable = _parse_points(series.engine_data, 'engine')
+            if sortable:
+                store.append(identifier, 'engine', engine_ts, engine_values)
+
+
+def load_stored_series(store, start=None, end=None):
+    """
+    Fuel series of every stored vehicle between start and end, read from a SeriesStore
+    instead of the HTML export. Returns (datasets as ParsedSeries, identifiers).
+    """
+    datasets = []
+    identifiers = []
+    for identifier in store.identifiers():
+        timestamps, fuel = store.load(identifier, start, end)
+        if len(np.unique(fuel)) <= 1:
+            continue
+        datasets.append(ParsedSeries.from_arrays(timestamps.astype(np.float64), fuel.astype(np.float64)))
+        identifiers.append(identifier)
+    return datasets, identifiers
+
+
+def analysis_parameters(engine_tolerance=None):
+    """
+    Settings that change the computed report, part of the result cache key
+    """
+    return {
+        'threshold_percentage': REFILL_THRESHOLD_PERCENTAGE,
+        'time_window_minutes': REFILL_WINDOW_MINUTES,
+        'burst_window': REFILL_BURST_WINDOW,
+        'burst_threshold': REFILL_BURST_THRESHOLD,
+        'engine_tolerance_ms': _engine_tolerance(engine_tolerance),
+    }
+
+
+def analyze_files(file_path1, file_path2, engine_file=None, workers=1, store=None, rolling=None,
+                  engine_tolerance=None):
+    """
+    Load and analyze the fuel, road and engine exports, appending the parsed series
+    to store (a SeriesStore) if given. With a RollingAnalysis the refills and fuel
+    levels come from its stitched history instead of this export alone.
+    Returns the VehicleReports and the date ranges of the fuel export.
+    """
     all_datasets = []
     all_identifiers = []
     all_date_ranges = []
 
     # Load datasets from the first HTML file with engine status
-    raw_datasets, active_identifiers, date_ranges = load_data_from_file(file_path1, engine_file)
+    registry = IdentifierRegistry()
+    raw_datasets, active_identifiers, date_ranges = load_data_from_file(file_path1, engine_file, registry,
+                                                                        engine_tolerance)
     all_identifiers.extend(active_identifiers)
     all_date_ranges.extend(date_ranges)
+    if rolling is not None:
+        all_datasets.extend(rolling.analyze(raw_datasets, active_identifiers))
+    else:
+        if store is not None:
+            store_series(store, raw_datasets, active_identifiers)
 
-    # Process each dataset from file_path1
-    for idx, data_pair in enumerate(raw_datasets):
-        raw_data, engine_data = data_pair
-        refills, stats = analyze_fuel_data(data_pair)
-        data = parse_data(raw_data, engine_data)
-        all_datasets.append((refills, stats, data))
+        # Process each dataset from file_path1
+        # Each series was parsed once by the loader, reuse it for analysis and export
+        results = analyze_datasets(raw_datasets, workers)
+        for series, (refills, stats) in zip(raw_datasets, results):
+            all_datasets.append((refills, stats, series.data))
+
+    count('refills_found', sum(len(refills) for refills, _, _ in all_datasets))
 
     # Load all daily distances and dates
-    all_daily_distances, combined_identifiers, all_daily_dates = load_daily_distances(file_path2, active_identifiers)
-    
-    # Find removed identifiers
-    removed_identifiers = [id for id in combined_identifiers if id not in active_identifiers]
+    all_daily_distances, combined_identifiers, all_daily_dates = load_daily_distances(file_path2, active_identifiers,
+                                                                                       registry)
+
+    # Find removed identifiers: vehicles that are only in the road report
+    active = set(active_identifiers)
+    first_index = {}
+    for idx, identifier in enumerate(combined_identifiers):
+        if identifier not in active:
+            first_index.setdefault(identifier, idx)
+    removed_identifiers = [identifier for identifier in combined_identifiers if identifier not in active]
     all_identifiers = active_identifiers + removed_identifiers
 
     # Create empty datasets for removed identifiers
-    for i, removed_id in enumerate(removed_identifiers):
-        # Find the index in combined_identifiers
-        try:
-            idx = combined_identifiers.index(removed_id)
-            # Check if the index is valid for all_daily_dates
-            if idx < len(all_daily_dates):
-                daily_dates = all_daily_dates[idx]
-            else:
-                daily_dates = []
-        except (ValueError, IndexError):
-            # Handle case where index is not found or out of range
-            daily_dates = []
-        
+    for removed_id in removed_identifiers:
+        idx = first_index[removed_id]
+        daily_dates = all_daily_dates[idx] if idx < len(all_daily_dates) else []
+
         empty_refills = []
         empty_stats = {'num_refills': 0, 'first_fuel': 0, 'last_fuel': 0}
         empty_data = []
@@ -760,26 +1212,75 @@ def main(file_path1, file_path2, engine_file=None):
         
         all_datasets.append((empty_refills, empty_stats, empty_data))
 
+    return build_report(all_datasets, all_identifiers, all_daily_distances, all_daily_dates), all_date_ranges
+
+
+def main(file_path1, file_path2, engine_file=None, workers=1, output_format='xlsx', output_dir=None,
+         output_file=None, cache=None, store=None, rolling=None, engine_tolerance=None):
+    """
+    Analyze the fuel, road and engine exports and write the report.
+    workers > 1 analyzes vehicles in parallel (None uses one worker per CPU).
+    output_format 'xlsx' returns the Excel file (output_file, a temporary file by default);
+    'csv', 'ndjson' or 'parquet' write the summary, refill and daily tables to output_dir
+    (a temporary directory by default) and return that directory.
+    With a ResultCache, unchanged input files skip parsing and analysis.
+    With a SeriesStore, newly parsed series are appended to it (not on a cache hit,
+    those inputs were stored when they were first analyzed).
+    With a RollingAnalysis the report covers the new period of the stored history;
+    its results depend on that history so the cache is not used.
+    engine_tolerance defaults to ENGINE_TOLERANCE_MS at the time of the call.
+    """
+    # Reject an unknown format before the analysis instead of after it
+    if output_format != 'xlsx' and output_format not in SINKS:
+        raise ValueError(f"Unknown output format: {output_format} (expected one of xlsx, {', '.join(SINKS)})")
+    engine_tolerance = _engine_tolerance(engine_tolerance)
+    cached = None
+    if rolling is not None:
+        cache = None
+    if cache is not None:
+        cache_key = cache.key([file_path1, file_path2, engine_file], analysis_parameters(engine_tolerance))
+        cached = cache.get(cache_key)
+
+    if cached is not None:
+        print("Using cached analysis of unchanged input files")
+        reports, all_date_ranges = cached
+    else:
+        reports, all_date_ranges = analyze_files(file_path1, file_path2, engine_file, workers, store, rolling,
+                                                 engine_tolerance)
+        if cache is not None:
+            cache.put(cache_key, (reports, all_date_ranges))
+
+    # Machine-readable tables skip the Excel rendering entirely
+    if output_format != 'xlsx':
+        output_dir = output_dir or tempfile.mkdtemp(prefix='fuel_analysis_')
+        tables = report_tables(reports)
+        write_tables(tables, output_format, output_dir)
+        count('rows_written', sum(len(rows) for rows in tables.values()))
+        return output_dir, len(reports)
+
     # Create temporary file for Excel output
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as tmp:
-        temp_path = tmp.name
+    if output_file:
+        temp_path = output_file
+    else:
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as tmp:
+            temp_path = tmp.name
 
     # Export data to Excel
-    excel_file, num_datasets = export_to_excel(
-        all_datasets, 
-        all_identifiers, 
-        all_date_ranges, 
-        all_daily_distances,
-        all_daily_dates,
-        output_file=temp_path
-    )
+    try:
+        write_excel_report(reports, all_date_ranges, temp_path)
+    except Exception as e:
+        print(f"Error exporting to Excel: {str(e)}")
+        return None, 0
 
-    return excel_file, num_datasets
+    return temp_path, len(reports)
 
 if __name__ == "__main__":
-    file_path1 = 'C:/Users/User/Desktop/ttt/web/test/tulsh.html'
-    file_path2 = 'C:/Users/User/Desktop/ttt/web/test/zam.html'
-    engine_file = 'C:/Users/User/Desktop/ttt/web/test/tog.html'  # Add engine status file path
+    # python fuel_analysis.py <fuel> <road> [<engine>], see `python reciver.py analyze` for the full CLI
+    import sys
+    if len(sys.argv) not in (3, 4):
+        sys.exit("Usage: python fuel_analysis.py <fuel file> <road file> [<engine file>]")
+    file_path1, file_path2 = sys.argv[1:3]
+    engine_file = sys.argv[3] if len(sys.argv) == 4 else None
     excel_file, num_datasets = main(file_path1, file_path2, engine_file)
     if excel_file:
         print(f"Analysis of {num_datasets} datasets exported to {excel_file}")
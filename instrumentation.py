@@ -0,0 +1,140 @@
+"""
+Stage timers and counters for the report pipeline. Nothing is recorded until start_run();
+finish_run() writes what was recorded as a JSON run report.
+"""
+import cProfile
+import functools
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+_run = None
+
+
+class RunReport:
+    """
+    Wall and CPU time, call count and optionally the tracemalloc peak of every stage,
+    plus named counters. CPU time is for the whole process, including other threads.
+    """
+
+    def __init__(self, trace_memory=False, profile=False):
+        self.started = datetime.now().isoformat(timespec='seconds')
+        self.stages = {}
+        self.counters = {}
+        self.trace_memory = trace_memory
+        self.profiler = cProfile.Profile() if profile else None
+        self._stack = []  # tracemalloc peaks of the open stages
+        self._peak = 0  # Peak of the whole run, the tracemalloc peak is reset per stage
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+
+    def _record(self, name, wall, cpu, peak):
+        entry = self.stages.setdefault(name, {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0})
+        entry['calls'] += 1
+        entry['wall_seconds'] += wall
+        entry['cpu_seconds'] += cpu
+        if peak is not None:
+            entry['peak_bytes'] = max(entry.get('peak_bytes', 0), peak)
+
+    def as_dict(self):
+        return {
+            'started': self.started,
+            'wall_seconds': time.perf_counter() - self._wall,
+            'cpu_seconds': time.process_time() - self._cpu,
+            'stages': self.stages,
+            'counters': self.counters,
+        }
+
+
+def start_run(trace_memory=False, profile=False):
+    """
+    Start recording stages and counters. trace_memory records the tracemalloc peak of
+    every stage (slows the run down), profile runs cProfile until finish_run.
+    """
+    global _run
+    _run = RunReport(trace_memory, profile)
+    if trace_memory:
+        tracemalloc.start()
+    if _run.profiler is not None:
+        _run.profiler.enable()
+    return _run
+
+
+def finish_run(path):
+    """
+    Stop recording and write the run report to path. The cProfile statistics, if
+    profiling, go next to it with a .prof extension. Returns the report.
+    """
+    global _run
+    run, _run = _run, None
+    if run is None:
+        return None
+
+    report = run.as_dict()
+    if run.profiler is not None:
+        run.profiler.disable()
+        report['profile'] = os.path.splitext(path)[0] + '.prof'
+        run.profiler.dump_stats(report['profile'])
+    if run.trace_memory:
+        report['peak_bytes'] = max(run._peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=1)
+    return report
+
+
+@contextmanager
+def stage(name):
+    run = _run
+    if run is None:
+        yield
+        return
+
+    if run.trace_memory:
+        # The peak is reset per stage, carry what was reached so far to the enclosing one
+        reached = tracemalloc.get_traced_memory()[1]
+        run._peak = max(run._peak, reached)
+        if run._stack:
+            run._stack[-1] = max(run._stack[-1], reached)
+        tracemalloc.reset_peak()
+        run._stack.append(0)
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+        peak = None
+        if run.trace_memory:
+            peak = max(run._stack.pop(), tracemalloc.get_traced_memory()[1])
+            run._peak = max(run._peak, peak)
+            if run._stack:
+                run._stack[-1] = max(run._stack[-1], peak)
+            tracemalloc.reset_peak()
+        run._record(name, wall, cpu, peak)
+
+
+def timed(name):
+    """Decorator that records every call of the function as the stage name"""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _run is None:
+                return function(*args, **kwargs)
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, amount=1):
+    if _run is not None:
+        _run.counters[name] = _run.counters.get(name, 0) + int(amount)
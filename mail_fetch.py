@@ -0,0 +1,382 @@
+"""
+IMAP helpers for downloading report attachments: server-side SEARCH, one batched
+BODYSTRUCTURE/ENVELOPE fetch, then only the attachment parts that are needed
+"""
+import base64
+import imaplib
+import quopri
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.header import decode_header, make_header
+from email.utils import decode_rfc2231
+from urllib.parse import unquote
+
+_TOKEN = re.compile(rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|([^\s()"\[]+(?:\[[^\]]*\][^\s()"\[]*)?))', re.DOTALL)
+_LITERAL = re.compile(rb'\{(\d+)\}$')
+_NOT_BASE64 = re.compile(rb'[^A-Za-z0-9+/=]')
+RETRY_DELAY = 2  # seconds, multiplied by the attempt number
+# Attachments are downloaded in slices of this size, never more than FETCH_BUDGET per FETCH
+PART_CHUNK_SIZE = 1024 * 1024
+FETCH_BUDGET = 8 * PART_CHUNK_SIZE
+
+
+class _Literal(bytes):
+    """Literal string from a fetch response, kept apart from atoms such as NIL"""
+
+
+def _tokens(data):
+    # imaplib returns FETCH data as bytes lines and (prefix, literal) tuples
+    for item in data:
+        if item is None:
+            continue
+        if isinstance(item, tuple):
+            prefix, literal = item
+            yield from _line_tokens(_LITERAL.sub(b'', prefix.rstrip()))
+            yield _Literal(literal)
+        else:
+            yield from _line_tokens(item)
+
+
+def _line_tokens(line):
+    pos = 0
+    while True:
+        match = _TOKEN.match(line, pos)
+        if not match:
+            return
+        pos = match.end()
+        open_paren, close_paren, quoted, atom = match.groups()
+        if open_paren:
+            yield '('
+        elif close_paren:
+            yield ')'
+        elif quoted is not None:
+            yield _Literal(re.sub(rb'\\(.)', rb'\1', quoted))
+        else:
+            yield atom
+
+
+def parse_fetch_response(data):
+    """
+    Parse the data of an imaplib FETCH response into {uid: {item name: value}}.
+    Lists become Python lists, strings bytes and NIL None.
+    """
+    responses = {}
+    stack = []
+    for token in _tokens(data):
+        if token == '(':
+            stack.append([])
+        elif token == ')':
+            if not stack:
+                continue
+            items = stack.pop()
+            if stack:
+                stack[-1].append(items)
+                continue
+            fields = {}
+            for name, value in zip(items[::2], items[1::2]):
+                fields[name.decode('ascii').upper()] = value
+            if 'UID' in fields:
+                responses[int(fields['UID'])] = fields
+        elif stack:
+            stack[-1].append(None if token.upper() == b'NIL' and not isinstance(token, _Literal) else token)
+    return responses
+
+
+def _text(value):
+    if value is None:
+        return ''
+    text = value.decode('utf-8', errors='ignore') if isinstance(value, bytes) else value
+    try:
+        return str(make_header(decode_header(text)))
+    except Exception:
+        return text
+
+
+def _params(values):
+    # Body parameter lists are (name value name value ...), RFC 2231 names end in '*'
+    params = {}
+    if isinstance(values, list):
+        for name, value in zip(values[::2], values[1::2]):
+            if name is not None:
+                params[name.decode('ascii', errors='ignore').lower()] = value.decode('utf-8', errors='ignore') if value else ''
+    return params
+
+
+def _filename(disposition_params, body_params):
+    for params in (disposition_params, body_params):
+        for key in ('filename', 'name'):
+            if key + '*' in params:
+                charset, _, value = decode_rfc2231(params[key + '*'])
+                return unquote(value, encoding=charset or 'utf-8', errors='replace')
+            if key in params:
+                return _text(params[key])
+    return None
+
+
+def attachment_parts(structure, section=''):
+    """
+    List (section, filename, encoding) for every part of a BODYSTRUCTURE that has a
+    Content-Disposition and a filename, the parts message.walk() used to save
+    """
+    if not isinstance(structure, list) or not structure:
+        return []
+
+    if isinstance(structure[0], list):
+        # multipart: child parts first, then the subtype and extension data
+        parts = []
+        number = 0
+        for child in structure:
+            if not isinstance(child, list):
+                break
+            number += 1
+            parts.extend(attachment_parts(child, f"{section}.{number}" if section else str(number)))
+        return parts
+
+    section = section or '1'
+    media_type = (structure[0] or b'').decode('ascii', errors='ignore').lower()
+    subtype = (structure[1] or b'').decode('ascii', errors='ignore').lower()
+    encoding = (structure[5] or b'7bit').decode('ascii', errors='ignore').lower()
+
+    # Extension data starts after the fields every part has, plus the
+    # envelope/body/lines of message/rfc822 and the lines of text parts
+    if media_type == 'message' and subtype == 'rfc822':
+        body = structure[8] if len(structure) > 8 else None
+        # A non-multipart body of an attached message is its part <section>.1
+        nested = attachment_parts(body, section if body and isinstance(body[0], list) else section + '.1')
+        extension = 10
+    else:
+        nested = []
+        extension = 8 if media_type == 'text' else 7
+
+    disposition = structure[extension + 1] if len(structure) > extension + 1 else None
+    if not isinstance(disposition, list):
+        return nested
+
+    filename = _filename(_params(disposition[1] if len(disposition) > 1 else None), _params(structure[2]))
+    if filename:
+        return [(section, filename, encoding)] + nested
+    return nested
+
+
+class _Base64Decoder:
+    """Decode base64 as it arrives, carrying incomplete 4-character groups over"""
+
+    def __init__(self):
+        self.pending = b''
+
+    def decode(self, data, final=False):
+        data = self.pending + _NOT_BASE64.sub(b'', data)
+        if final:
+            self.pending = b''
+            # Like message.get_payload(decode=True), tolerate missing padding;
+            # a single leftover character cannot be decoded
+            data = data.rstrip(b'=')
+            data = data[:-1] if len(data) % 4 == 1 else data
+            return base64.b64decode(data + b'=' * (-len(data) % 4))
+        cut = len(data) - len(data) % 4
+        self.pending = data[cut:]
+        return base64.b64decode(data[:cut])
+
+
+class _QuotedPrintableDecoder:
+    """Decode quoted-printable line by line, keeping the last unfinished line"""
+
+    def __init__(self):
+        self.pending = b''
+
+    def decode(self, data, final=False):
+        data = self.pending + data
+        cut = len(data) if final else data.rfind(b'\n') + 1
+        self.pending = data[cut:]
+        return quopri.decodestring(data[:cut]) if cut else b''
+
+
+class _PlainDecoder:
+    def decode(self, data, final=False):
+        return data
+
+
+def part_decoder(encoding):
+    """
+    Incremental decoder for a Content-Transfer-Encoding
+    """
+    encoding = (encoding or '').lower()
+    if encoding == 'base64':
+        return _Base64Decoder()
+    if encoding == 'quoted-printable':
+        return _QuotedPrintableDecoder()
+    return _PlainDecoder()
+
+
+def _quote(value):
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def select_mailbox(mail, mailbox='inbox'):
+    """
+    SELECT the mailbox and return its UIDVALIDITY, None if the server did not send one
+    """
+    mail.select(mailbox)
+    _, data = mail.response('UIDVALIDITY')
+    try:
+        return int(data[0])
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def search_uids(mail, since, sender=None, subject=None):
+    """
+    UID SEARCH for messages since the given date, narrowed on the server by sender/subject
+    """
+    criteria = ['SINCE', since]
+    if sender:
+        criteria += ['FROM', _quote(sender)]
+    if subject:
+        if subject.isascii():
+            criteria += ['SUBJECT', _quote(subject)]
+        else:
+            # Non-ASCII search strings are sent as a UTF-8 literal after the last argument
+            criteria = ['CHARSET', 'UTF-8'] + criteria + ['SUBJECT']
+            mail.literal = subject.encode('utf-8')
+    status, data = mail.uid('SEARCH', *criteria)
+    if status != 'OK' or not data or not data[0]:
+        return []
+    return [int(uid) for uid in data[0].split()]
+
+
+def fetch_structures(mail, uids):
+    """
+    Fetch the subject and attachment parts of all messages in one UID FETCH.
+    Returns {uid: (subject, [(section, filename, encoding), ...])}.
+    """
+    if not uids:
+        return {}
+    status, data = mail.uid('FETCH', ','.join(str(uid) for uid in uids), '(UID BODYSTRUCTURE ENVELOPE)')
+    if status != 'OK':
+        return {}
+
+    messages = {}
+    for uid, fields in parse_fetch_response(data).items():
+        envelope = fields.get('ENVELOPE')
+        subject = _text(envelope[1]) if isinstance(envelope, list) and len(envelope) > 1 else ''
+        messages[uid] = (subject, attachment_parts(fields.get('BODYSTRUCTURE')))
+    return messages
+
+
+def fetch_parts(mail, wanted, open_part, done=None):
+    """
+    Stream body parts given as {uid: [(section, encoding), ...]} into writers from
+    open_part() (with write, close and discard). Each part is fetched in PART_CHUNK_SIZE
+    slices and decoded as it arrives; messages asking for the same slices share one
+    UID FETCH of at most FETCH_BUDGET bytes. Completed parts are added to `done` as
+    {(uid, section): closed writer}, which is also returned. Parts the server did not
+    return are left out so they can be asked for again.
+    """
+    done = {} if done is None else done
+    pending = {uid: dict(parts) for uid, parts in wanted.items() if parts}
+    streams = {}  # (uid, section) -> [offset, decoder, writer]
+
+    try:
+        while pending:
+            # Group messages by the slices they need next
+            groups = {}
+            for uid, parts in pending.items():
+                key = tuple((section, streams[(uid, section)][0] if (uid, section) in streams else 0)
+                            for section in parts)
+                groups.setdefault(key, []).append(uid)
+
+            for key, uids in groups.items():
+                step = max(1, FETCH_BUDGET // (PART_CHUNK_SIZE * len(key)))
+                items = ' '.join(f'BODY.PEEK[{section}]<{offset}.{PART_CHUNK_SIZE}>' for section, offset in key)
+                for start in range(0, len(uids), step):
+                    batch = uids[start:start + step]
+                    status, data = mail.uid('FETCH', ','.join(str(uid) for uid in batch), f'(UID {items})')
+                    responses = parse_fetch_response(data) if status == 'OK' else {}
+
+                    for uid in batch:
+                        fields = responses.get(uid, {})
+                        for section, offset in key:
+                            stream_key = (uid, section)
+                            encoding = pending[uid].pop(section)
+                            chunk = fields.get(f'BODY[{section}]<{offset}>')
+                            if chunk is None:
+                                if stream_key in streams:
+                                    streams.pop(stream_key)[2].discard()
+                                continue
+
+                            if stream_key not in streams:
+                                streams[stream_key] = [0, part_decoder(encoding), open_part()]
+                            stream = streams[stream_key]
+                            stream[0] += len(chunk)
+                            stream[2].write(stream[1].decode(chunk))
+                            if len(chunk) < PART_CHUNK_SIZE:
+                                # Short slice: the end of the part
+                                stream[2].write(stream[1].decode(b'', final=True))
+                                stream[2].close()
+                                done[stream_key] = streams.pop(stream_key)[2]
+                            else:
+                                pending[uid][section] = encoding
+                        if not pending[uid]:
+                            del pending[uid]
+    finally:
+        for _, _, writer in streams.values():
+            writer.discard()
+    return done
+
+
+def _fetch_batch(connect, wanted, open_part, mailbox, uidvalidity, retries):
+    # One worker: its own session, parts that did not come back are asked for again
+    done = {}
+    mail = None
+    for attempt in range(retries + 1):
+        pending = {uid: [(section, encoding) for section, encoding in parts if (uid, section) not in done]
+                   for uid, parts in wanted.items()}
+        pending = {uid: parts for uid, parts in pending.items() if parts}
+        if not pending:
+            break
+        if attempt:
+            time.sleep(RETRY_DELAY * attempt)
+        try:
+            if mail is None:
+                mail = connect()
+                if mail is None:
+                    continue
+                if select_mailbox(mail, mailbox) != uidvalidity:
+                    print(f"Mailbox {mailbox} changed during the download, skipping {len(pending)} emails")
+                    break
+            fetch_parts(mail, pending, open_part, done)
+        except (imaplib.IMAP4.abort, OSError) as e:
+            print(f"Download connection failed ({e}), retrying")
+            mail = None
+        except imaplib.IMAP4.error as e:
+            print(f"Download failed: {e}")
+            break
+
+    if mail is not None:
+        try:
+            mail.logout()
+        except (imaplib.IMAP4.error, OSError):
+            pass
+    return done
+
+
+def fetch_parts_concurrently(connect, wanted, connections, open_part, mailbox='inbox', uidvalidity=None, retries=2):
+    """
+    Download body parts like fetch_parts, with the messages split into contiguous UID
+    ranges over at most `connections` sessions opened by connect(). Parts missing after
+    a failed or refused fetch are retried on a fresh session.
+    """
+    uids = sorted(wanted)
+    if not uids:
+        return {}
+    connections = max(1, min(connections, len(uids)))
+    size = -(-len(uids) // connections)
+    batches = [{uid: wanted[uid] for uid in uids[i:i + size]} for i in range(0, len(uids), size)]
+
+    done = {}
+    with ThreadPoolExecutor(max_workers=len(batches)) as pool:
+        for result in pool.map(lambda batch: _fetch_batch(connect, batch, open_part, mailbox, uidvalidity, retries),
+                               batches):
+            done.update(result)
+    return done
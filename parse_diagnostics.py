@@ -0,0 +1,34 @@
+"""
+Malformed points found while parsing, collected and summarized instead of printed one by one
+"""
+from instrumentation import count
+
+# Malformed points quoted per reason in a summary
+DIAGNOSTIC_SAMPLES = 3
+
+
+class ParseDiagnostics:
+    """
+    Malformed points of one vehicle counted by series label and reason, with the first
+    few of each kept as samples. report() prints one line per reason and starts over.
+    """
+
+    def __init__(self, vehicle=None, samples=DIAGNOSTIC_SAMPLES):
+        self.vehicle = vehicle
+        self.samples = samples
+        self.problems = {}  # (label, reason) -> [count, samples]
+
+    def add(self, label, reason, points):
+        """Count the malformed points (raw point texts) of a fuel or engine series"""
+        if not len(points):
+            return
+        entry = self.problems.setdefault((label, reason), [0, []])
+        entry[0] += len(points)
+        entry[1].extend(f"[{point}]" for point in points[:self.samples - len(entry[1])])
+        count('points_malformed', len(points))
+
+    def report(self):
+        prefix = f"{self.vehicle}: " if self.vehicle else ""
+        for (label, reason), (number, samples) in self.problems.items():
+            print(f"Warning: {prefix}skipped {number} {label} points {reason}, e.g. {', '.join(samples)}")
+        self.problems = {}
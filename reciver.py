@@ -1,19 +1,74 @@
 import re
 import os
+import sys
+import argparse
 import imaplib
-import email
-from email.header import decode_header
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email import encoders
 from smtplib import SMTP
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta
+from mail_fetch import select_mailbox, search_uids, fetch_structures, fetch_parts, fetch_parts_concurrently
+from attachment_store import AttachmentStore
+from result_cache import ResultCache
+from instrumentation import count, finish_run, start_run, timed
 
 EMAIL_ADDRESS = os.environ.get("EMAIL_ADDRESS")
 EMAIL_PASSWORD = os.environ.get("EMAIL_PASSWORD")
 EMAIL_SEND = os.environ.get("EMAIL_SEND")
+# Where downloaded attachments are kept between runs
+ATTACHMENT_DIR = os.environ.get("ATTACHMENT_DIR", "./gmail_attachments")
+# Number of worker processes for the per-vehicle analysis (1 = serial)
+ANALYSIS_WORKERS = int(os.environ.get("ANALYSIS_WORKERS", "1"))
+# Report output: xlsx (emailed) or csv / ndjson / parquet tables written to REPORT_DIR
+REPORT_FORMAT = os.environ.get("REPORT_FORMAT", "xlsx")
+REPORT_DIR = os.environ.get("REPORT_DIR", "./reports")
+# Excel report of the latest set, kept in REPORT_DIR so it can be sent again
+LATEST_REPORT_NAME = "UAZday1.xlsx"
+# Optional server-side narrowing of the mailbox search
+REPORT_SENDER = os.environ.get("REPORT_SENDER")
+REPORT_SUBJECT = os.environ.get("REPORT_SUBJECT")
+# Parallel IMAP sessions for downloading attachments (1 = reuse the search session)
+IMAP_CONNECTIONS = int(os.environ.get("IMAP_CONNECTIONS", "1"))
+# Analyze every complete date-range set instead of only the latest one
+REPORT_BATCH = os.environ.get("REPORT_BATCH", "").lower() in ("1", "true", "yes")
+# Analysis results of unchanged input files are reused from here (empty to disable)
+REPORT_CACHE_DIR = os.environ.get("REPORT_CACHE_DIR", "./report_cache")
+REPORT_CACHE_MAX_MB = int(os.environ.get("REPORT_CACHE_MAX_MB", "256"))
+# Parsed vehicle series of the latest set are appended to this columnar store (empty to disable)
+SERIES_STORE_DIR = os.environ.get("SERIES_STORE_DIR", "")
+# Report the latest set as a rolling period of the stored history (needs SERIES_STORE_DIR)
+REPORT_ROLLING = os.environ.get("REPORT_ROLLING", "").lower() in ("1", "true", "yes")
+ROLLING_OVERLAP_MINUTES = int(os.environ.get("ROLLING_OVERLAP_MINUTES", "180"))
+# Maximum age of the engine reading that sets the state of a fuel sample, in ms (empty: any age)
+ENGINE_TOLERANCE_MS = float(os.environ["ENGINE_TOLERANCE_MS"]) if os.environ.get("ENGINE_TOLERANCE_MS") else None
+# JSON run report with stage timings and counters, written next to the report
+RUN_REPORT = os.environ.get("RUN_REPORT", "1").lower() in ("1", "true", "yes")
+# Opt-in: tracemalloc peak per stage and a cProfile dump next to the run report
+RUN_TRACE_MEMORY = os.environ.get("RUN_TRACE_MEMORY", "").lower() in ("1", "true", "yes")
+RUN_PROFILE = os.environ.get("RUN_PROFILE", "").lower() in ("1", "true", "yes")
 # --- Helper functions ---
+def report_cache():
+    if not REPORT_CACHE_DIR:
+        return None
+    return ResultCache(REPORT_CACHE_DIR, REPORT_CACHE_MAX_MB * 1024 * 1024)
+
+def series_store():
+    if not SERIES_STORE_DIR:
+        return None
+    from series_store import SeriesStore
+    return SeriesStore(SERIES_STORE_DIR)
+
+def rolling_analysis():
+    store = series_store()
+    if not REPORT_ROLLING or store is None:
+        return None
+    from rolling_analysis import RollingAnalysis
+    return RollingAnalysis(store, ROLLING_OVERLAP_MINUTES)
+
 def sanitize_filename(filename):
     return re.sub(r'[\\/*?:"<>|]', '_', filename)
 
@@ -33,122 +88,174 @@ def extract_date_range(filename):
 
 # --- Gmail Attachment Downloader ---
 
-def save_attachments_from_gmail(save_directory):
+def is_report_attachment(filename):
+    """
+    Fuel, engine and road exports carry their date range in the file name
+    """
+    name = filename.lower()
+    return any(kind in name for kind in ("fuel", "engine", "road")) and extract_date_range(filename)[0] is not None
+
+def connect_gmail():
     print(f"Connecting to Gmail...")
     mail = imaplib.IMAP4_SSL('imap.gmail.com')
-    
     try:
         mail.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
     except imaplib.IMAP4.error as e:
         print(f"Login failed: {e}")
-        return []
-    
-    mail.select('inbox')
+        return None
+    return mail
+
+@timed('imap_download')
+def save_attachments_from_gmail(save_directory, mail=None, name_filter=is_report_attachment,
+                                connect=None, connections=IMAP_CONNECTIONS):
+    # An already authenticated IMAP connection can be passed in (and is left open),
+    # connect() opens the extra sessions used when connections > 1
+    own_connection = mail is None
+    if own_connection:
+        mail = connect_gmail()
+        if mail is None:
+            return []
+        connect = connect or connect_gmail
+
+    uidvalidity = select_mailbox(mail, 'inbox')
 
     # Get last 3 days in IMAP format (matches the script)
     date_since = (datetime.now() - timedelta(days=3)).strftime('%d-%b-%Y')
 
-    # Search for emails since that date
+    # Search for emails since that date, narrowed on the server when a sender/subject is set
     print(f"Searching for emails since {date_since}...")
-    status, email_ids = mail.search(None, f'(SINCE {date_since})')
-    email_ids = email_ids[0].split()
-    
-    print(f"Found {len(email_ids)} emails to check.")
+    uids = search_uids(mail, date_since, REPORT_SENDER, REPORT_SUBJECT)
 
     if not os.path.exists(save_directory):
         os.makedirs(save_directory)
 
-    attachment_files = []
+    # Only messages above the last synced UID are fetched, older ones are already on disk
+    store = AttachmentStore(save_directory)
+    store.check_uidvalidity(uidvalidity)
+    new_uids = store.new_uids(uids)
+
+    print(f"Found {len(uids)} emails to check, {len(new_uids)} new since the last sync.")
+
+    downloaded = 0
     print(f"Downloading attachments from emails SINCE {date_since}:\n")
 
-    for e_id in email_ids:
-        try:
-            status, data = mail.fetch(e_id, '(RFC822)')
-            raw_email = data[0][1]
-            msg = email.message_from_bytes(raw_email)
-
-            subject = msg.get("Subject", "")
-            decoded_subject = decode_header(subject)
-            full_subject = ''.join(
-                part.decode(enc or "utf-8", errors="ignore") if isinstance(part, bytes) else part
-                for part, enc in decoded_subject
-            )
-
-            has_attachment = False
-
-            for part in msg.walk():
-                if part.get_content_maintype() == 'multipart':
-                    continue
-                if part.get('Content-Disposition') is None:
-                    continue
-
-                file_name = part.get_filename()
-                if file_name:
-                    has_attachment = True
-                    safe_file_name = sanitize_filename(file_name)
-                    file_path = os.path.join(save_directory, safe_file_name)
-                    
+    # Look at the structure of all messages first and only download the wanted parts
+    try:
+        messages = fetch_structures(mail, new_uids)
+    except Exception as e:
+        print(f"Error reading email structure: {e}")
+        messages = {}
+
+    wanted = {}
+    for uid, (subject, parts) in messages.items():
+        parts = [part for part in parts if name_filter is None or name_filter(part[1])]
+        if parts:
+            wanted[uid] = parts
+
+    # Attachments are streamed to temporary files and moved into place in UID order
+    payloads = {}
+    try:
+        downloads = {uid: [(section, encoding) for section, _, encoding in attachments]
+                     for uid, attachments in wanted.items()}
+        if connections > 1 and connect is not None:
+            print(f"Downloading {len(downloads)} emails over {connections} connections")
+            payloads = fetch_parts_concurrently(connect, downloads, connections, store.open_part, 'inbox', uidvalidity)
+        else:
+            fetch_parts(mail, downloads, store.open_part, payloads)
+    except Exception as e:
+        print(f"Error downloading attachments: {e}")
+
+    # A message counts as synced once all of its wanted attachments are stored
+    completed = set(messages) - set(wanted)
+    for uid in sorted(wanted):
+        has_attachment = False
+        complete = True
+        for section, file_name, encoding in wanted[uid]:
+            part = payloads.get((uid, section))
+            if part is None:
+                complete = False
+                continue
+            try:
+                has_attachment = True
+                safe_file_name = sanitize_filename(file_name)
+
+                file_path, written = store.save(uid, safe_file_name, part)
+                if written:
                     print(f"Saving: {safe_file_name}")
-                    with open(file_path, 'wb') as f:
-                        f.write(part.get_payload(decode=True))
-                    attachment_files.append(file_path)
+                    downloaded += 1
+                else:
+                    print(f"Unchanged: {safe_file_name}")
+            except Exception as e:
+                part.discard()
+                complete = False
+                print(f"Error processing email: {e}")
 
-            if has_attachment:
-                print(f"- Downloaded from email: '{full_subject}'")
-        except Exception as e:
-            print(f"Error processing email: {e}")
+        if complete:
+            completed.add(uid)
+        if has_attachment:
+            print(f"- Downloaded from email: '{messages[uid][0]}'")
+
+    store.advance(completed, new_uids)
+    store.write()
 
-    mail.logout()
-    print(f"Total attachments downloaded: {len(attachment_files)}")
+    # Attachments of every message in the search window, stored earlier or just now
+    attachment_files = store.files_for(uids)
+
+    if own_connection:
+        mail.logout()
+    count('attachments_downloaded', downloaded)
+    print(f"Total attachments downloaded: {downloaded} ({len(attachment_files)} available)")
     return attachment_files
 
 # --- Email Sender ---
 
-def send_email_with_attachment(to_email, subject, body, file_path):
-    from_email = EMAIL_ADDRESS
-    password = EMAIL_PASSWORD
-
-    print(f"Preparing to send email to {to_email}...")
-    
+def build_email_with_attachment(to_email, subject, body, file_path):
     msg = MIMEMultipart()
-    msg['From'] = from_email
+    msg['From'] = EMAIL_ADDRESS
     msg['To'] = to_email
     msg['Subject'] = subject
     msg.attach(MIMEText(body))
 
-    try:
-        with open(file_path, 'rb') as attachment:
-            part = MIMEBase('application', 'octet-stream')
-            part.set_payload(attachment.read())
-            encoders.encode_base64(part)
-            part.add_header('Content-Disposition', f'attachment; filename={os.path.basename(file_path)}')
-            msg.attach(part)
-
-        with SMTP('smtp.gmail.com', 587) as server:
-            server.starttls()
-            server.login(from_email, password)
+    with open(file_path, 'rb') as attachment:
+        part = MIMEBase('application', 'octet-stream')
+        part.set_payload(attachment.read())
+        encoders.encode_base64(part)
+        part.add_header('Content-Disposition', f'attachment; filename={os.path.basename(file_path)}')
+        msg.attach(part)
+    return msg
+
+@timed('smtp_send')
+def send_emails(messages):
+    # All messages go out over one SMTP session
+    with SMTP('smtp.gmail.com', 587) as server:
+        server.starttls()
+        server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
+        for msg in messages:
             server.send_message(msg)
-            print(f"Email sent successfully to {to_email}")
+            count('emails_sent')
+            print(f"Email sent successfully to {msg['To']}")
+
+def send_email_with_attachment(to_email, subject, body, file_path):
+    print(f"Preparing to send email to {to_email}...")
+
+    try:
+        send_emails([build_email_with_attachment(to_email, subject, body, file_path)])
     except Exception as e:
         print(f"Failed to send email: {e}")
 
-# --- Main Script ---
-
-if __name__ == "__main__":
-    save_dir = "./gmail_attachments"
-    print("Starting Gmail attachment downloader...")
-    extracted_files = save_attachments_from_gmail(save_dir)
-    
-    if not extracted_files:
-        print("No attachments were downloaded. Check email credentials and inbox content.")
-        exit(1)
+# --- Report sets ---
 
-    # Organize by date range
-    print("\nOrganizing files by date range...")
+def group_report_sets(files, verbose=True):
+    """
+    Group downloaded files by date range and return the complete fuel/engine/road
+    sets as ((start, end), {'fuel': ..., 'engine': ..., 'road': ...}), newest first
+    """
+    log = print if verbose else (lambda *args: None)
+    log("\nOrganizing files by date range...")
     gps_pairs = {}
-    for f in extracted_files:
+    for f in files:
         base = os.path.basename(f)
-        print(f"Processing: {base}")
+        log(f"Processing: {base}")
         start, end = extract_date_range(base)
         if start and end:
             key = (start, end)
@@ -156,66 +263,262 @@ if __name__ == "__main__":
                 gps_pairs[key] = {}
             if "fuel" in base.lower():
                 gps_pairs[key]['fuel'] = f
-                print(f"  - Identified as fuel file")
+                log(f"  - Identified as fuel file")
             elif "engine" in base.lower():
                 gps_pairs[key]['engine'] = f
-                print(f"  - Identified as engine file")
+                log(f"  - Identified as engine file")
             elif "road" in base.lower():
                 gps_pairs[key]['road'] = f
-                print(f"  - Identified as road file")
+                log(f"  - Identified as road file")
         else:
-            print(f"  - No valid date range found in filename")
+            log(f"  - No valid date range found in filename")
 
     # Filter only complete sets
     valid_pairs = [(k, v) for k, v in gps_pairs.items() 
                   if 'fuel' in v and 'engine' in v and 'road' in v]
     valid_pairs.sort(key=lambda x: x[0][0], reverse=True)
+    return valid_pairs
 
-    print(f"\nFound {len(valid_pairs)} complete sets of files.")
-    
-    if valid_pairs:
-        latest_key, latest_files = valid_pairs[0]
-        start_date, end_date = latest_key
-        print(f"\nAnalyzing latest dataset ({start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}):")
-        
-        file_path1 = latest_files['fuel']
-        file_path2 = latest_files['road']
-        engine_file = latest_files['engine']
-        
-        print(f"- Fuel file: {os.path.basename(file_path1)}")
-        print(f"- Road file: {os.path.basename(file_path2)}")
-        print(f"- Engine file: {os.path.basename(engine_file)}")
-        
+def report_name(start_date, end_date):
+    return f"UAZ_{start_date.strftime('%Y-%m-%d_%H%M%S')}_{end_date.strftime('%Y-%m-%d_%H%M%S')}"
+
+def analyze_report_set(report_set, output_format=REPORT_FORMAT, report_dir=REPORT_DIR):
+    """
+    Write the report of one complete set to report_dir under its date-range name.
+    Returns (date range, report path, number of datasets); the path is None on failure.
+    """
+    from fuel_analysis import main
+
+    (start_date, end_date), files = report_set
+    name = report_name(start_date, end_date)
+    os.makedirs(report_dir, exist_ok=True)
+    try:
+        if output_format != "xlsx":
+            report_path, num_datasets = main(files['fuel'], files['road'], files['engine'],
+                                             output_format=output_format, output_dir=os.path.join(report_dir, name),
+                                             cache=report_cache(), engine_tolerance=ENGINE_TOLERANCE_MS)
+        else:
+            report_path, num_datasets = main(files['fuel'], files['road'], files['engine'],
+                                             output_file=os.path.join(report_dir, name + ".xlsx"),
+                                             cache=report_cache(), engine_tolerance=ENGINE_TOLERANCE_MS)
+    except Exception as e:
+        print(f"Error during analysis of {name}: {e}")
+        return (start_date, end_date), None, 0
+    return (start_date, end_date), report_path, num_datasets
+
+def run_batch(valid_pairs, workers=ANALYSIS_WORKERS):
+    """
+    Analyze every complete set (in parallel across sets when workers > 1) and email
+    all Excel reports in one SMTP session
+    """
+    print(f"\nAnalyzing {len(valid_pairs)} sets in batch mode...")
+    results = None
+    if workers is None or workers > 1:
         try:
-            # Import the analysis module
-            try:
-                from fuel_analysis import main
-                print("\nRunning fuel analysis...")
-                excel_file, num_datasets = main(file_path1, file_path2, engine_file)
-                
-                # Force the output file name
-                custom_excel_name = "UAZday1.xlsx"
-                if excel_file:
-                    new_excel_path = os.path.join(os.path.dirname(excel_file), custom_excel_name)
-                    os.rename(excel_file, new_excel_path)
-
-                    print(f"\nAnalysis of {num_datasets} datasets exported to {new_excel_path}")
-                    
-                    # Send email with attachment
-                    send_email_with_attachment(
-                        EMAIL_SEND,
-                        "Fuel Analysis Report",
-                        f"Please find the attached fuel analysis report for {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}.",
-                        new_excel_path
-                    )
-                else:
-                    print("Failed to export analysis to Excel")
-            except ImportError:
-                print("\nERROR: Could not import fuel_analysis module.")
-                print("Make sure the fuel_analysis.py file is in the same directory as this script.")
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(analyze_report_set, valid_pairs))
+        except (OSError, NotImplementedError, BrokenProcessPool) as e:
+            print(f"Parallel analysis unavailable ({e}), analyzing sets one by one")
+    if results is None:
+        results = [analyze_report_set(report_set) for report_set in valid_pairs]
+
+    messages = []
+    for (start_date, end_date), report_path, num_datasets in sorted(results):
+        period = f"{start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}"
+        if not report_path:
+            print(f"Failed to export analysis for {period}")
+            continue
+        print(f"Analysis of {num_datasets} datasets for {period} written to {report_path}")
+        if REPORT_FORMAT == "xlsx":
+            messages.append(build_email_with_attachment(
+                EMAIL_SEND,
+                f"Fuel Analysis Report {period}",
+                f"Please find the attached fuel analysis report for {period}.",
+                report_path
+            ))
+
+    if messages:
+        try:
+            send_emails(messages)
         except Exception as e:
-            print(f"\nError during analysis: {e}")
+            print(f"Failed to send email: {e}")
+
+def downloaded_attachments(save_directory=ATTACHMENT_DIR):
+    """
+    Report attachments already in save_directory, for the commands that work offline
+    """
+    if not os.path.isdir(save_directory):
+        return []
+    return [os.path.join(save_directory, name) for name in sorted(os.listdir(save_directory))
+            if is_report_attachment(name)]
+
+def write_latest_report(files):
+    """
+    Analyze one fuel/road/engine set with the settings of the latest-set report.
+    Returns (report path, number of datasets); the Excel report is written to
+    REPORT_DIR/LATEST_REPORT_NAME, tables to REPORT_DIR. The path is None on failure.
+    """
+    from fuel_analysis import main
+
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    if REPORT_FORMAT != "xlsx":
+        return main(files['fuel'], files['road'], files['engine'], workers=ANALYSIS_WORKERS,
+                    output_format=REPORT_FORMAT, output_dir=REPORT_DIR,
+                    cache=report_cache(), store=series_store(), rolling=rolling_analysis(),
+                    engine_tolerance=ENGINE_TOLERANCE_MS)
+    return main(files['fuel'], files['road'], files['engine'], workers=ANALYSIS_WORKERS,
+                output_file=os.path.join(REPORT_DIR, LATEST_REPORT_NAME),
+                cache=report_cache(), store=series_store(), rolling=rolling_analysis(),
+                engine_tolerance=ENGINE_TOLERANCE_MS)
+
+def run_latest(report_set):
+    """
+    Analyze the newest complete set and email its Excel report.
+    Returns the report path, None on failure.
+    """
+    (start_date, end_date), files = report_set
+    period = f"{start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}"
+    print(f"\nAnalyzing latest dataset ({period}):")
+    print(f"- Fuel file: {os.path.basename(files['fuel'])}")
+    print(f"- Road file: {os.path.basename(files['road'])}")
+    print(f"- Engine file: {os.path.basename(files['engine'])}")
+
+    try:
+        print("\nRunning fuel analysis...")
+        report_path, num_datasets = write_latest_report(files)
+    except ImportError as e:
+        print(f"\nERROR: Could not import the analysis modules: {e}")
+        return None
+    except Exception as e:
+        print(f"\nError during analysis: {e}")
+        return None
+
+    if not report_path:
+        print("Failed to export analysis to Excel")
+    elif REPORT_FORMAT != "xlsx":
+        # Machine consumers only need the tables: skip the Excel rendering and email
+        print(f"\nAnalysis of {num_datasets} datasets written as {REPORT_FORMAT} tables to {report_path}")
     else:
+        print(f"\nAnalysis of {num_datasets} datasets exported to {report_path}")
+        send_email_with_attachment(
+            EMAIL_SEND,
+            "Fuel Analysis Report",
+            f"Please find the attached fuel analysis report for {period}.",
+            report_path
+        )
+    return report_path
+
+# --- Command line ---
+
+def command_run(args):
+    print("Starting Gmail attachment downloader...")
+    extracted_files = save_attachments_from_gmail(ATTACHMENT_DIR)
+    if not extracted_files:
+        print("No attachments were downloaded. Check email credentials and inbox content.")
+        return 1
+
+    # Organize by date range
+    valid_pairs = group_report_sets(extracted_files)
+    print(f"\nFound {len(valid_pairs)} complete sets of files.")
+
+    if not valid_pairs:
         print("\nNo valid complete sets found for analysis.")
         print("Make sure your emails contain attachments with 'fuel', 'engine', and 'road' in their filenames")
-        print("and that the filenames contain valid date ranges in the format: YYYY-MM-DD HH_MM_SS_YYYY-MM-DD HH_MM_SS")
\ No newline at end of file
+        print("and that the filenames contain valid date ranges in the format: YYYY-MM-DD HH_MM_SS_YYYY-MM-DD HH_MM_SS")
+    elif args.command == "batch" or REPORT_BATCH:
+        run_batch(valid_pairs)
+    else:
+        report_path = run_latest(valid_pairs[0])
+        if report_path and REPORT_FORMAT == "xlsx":
+            args.run_report = os.path.splitext(report_path)[0] + ".run.json"
+    return 0
+
+def command_fetch(args):
+    print("Starting Gmail attachment downloader...")
+    extracted_files = save_attachments_from_gmail(ATTACHMENT_DIR)
+    if not extracted_files:
+        print("No attachments were downloaded. Check email credentials and inbox content.")
+        return 1
+    print(f"Found {len(group_report_sets(extracted_files, verbose=False))} complete sets of files in {ATTACHMENT_DIR}")
+    return 0
+
+def command_list(args):
+    valid_pairs = group_report_sets(downloaded_attachments(), verbose=False)
+    if not valid_pairs:
+        print(f"No complete sets of files in {ATTACHMENT_DIR}")
+    for (start_date, end_date), files in valid_pairs:
+        print(f"{start_date} - {end_date}  {report_name(start_date, end_date)}")
+        for kind in ('fuel', 'road', 'engine'):
+            print(f"  {kind}: {os.path.basename(files[kind])}")
+    return 0
+
+def command_analyze(args):
+    if args.files:
+        files = dict(zip(('fuel', 'road', 'engine'), args.files))
+    else:
+        valid_pairs = group_report_sets(downloaded_attachments(), verbose=False)
+        if not valid_pairs:
+            print(f"No complete sets of files in {ATTACHMENT_DIR}")
+            return 1
+        files = valid_pairs[0][1]
+
+    report_path, num_datasets = write_latest_report(files)
+    if not report_path:
+        print("Failed to export analysis")
+        return 1
+    print(f"Analysis of {num_datasets} datasets written to {report_path}")
+    if REPORT_FORMAT == "xlsx":
+        args.run_report = os.path.splitext(report_path)[0] + ".run.json"
+    return 0
+
+def command_send(args):
+    if not os.path.isfile(args.report):
+        print(f"No report at {args.report}")
+        return 1
+    send_email_with_attachment(args.to, args.subject, "Please find the attached fuel analysis report.", args.report)
+    return 0
+
+COMMANDS = {
+    "run": command_run,
+    "fetch": command_fetch,
+    "list": command_list,
+    "analyze": command_analyze,
+    "batch": command_run,
+    "send": command_send,
+}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Download the GPS exports from Gmail, analyze them and email the fuel report")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    commands.add_parser("run", help="download, analyze the latest set and email its report (the default)")
+    commands.add_parser("fetch", help=f"only download new attachments to {ATTACHMENT_DIR}")
+    commands.add_parser("list", help="list the complete date-range sets already downloaded")
+    analyze = commands.add_parser("analyze", help="analyze local files without any email")
+    analyze.add_argument("files", nargs="*", metavar="file",
+                         help="fuel, road and engine file (the latest downloaded set by default)")
+    commands.add_parser("batch", help="download, analyze every complete set and email all reports")
+    send = commands.add_parser("send", help="email an already written report")
+    send.add_argument("report", nargs="?", default=os.path.join(REPORT_DIR, LATEST_REPORT_NAME),
+                      help="report file (the latest Excel report by default)")
+    send.add_argument("--to", default=EMAIL_SEND, help="recipient (EMAIL_SEND by default)")
+    send.add_argument("--subject", default="Fuel Analysis Report")
+    args = parser.parse_args(argv)
+    if args.command == "analyze" and len(args.files) not in (0, 3):
+        parser.error("analyze takes the fuel, road and engine file, in that order")
+    args.command = args.command or "run"
+    return args
+
+# --- Main Script ---
+
+if __name__ == "__main__":
+    args = parse_args()
+    # Listing is a quick look at the local files, everything else gets a run report
+    if RUN_REPORT and args.command != "list":
+        start_run(trace_memory=RUN_TRACE_MEMORY, profile=RUN_PROFILE)
+    args.run_report = os.path.join(REPORT_DIR, "run_report.json")
+
+    status = COMMANDS[args.command](args)
+
+    if finish_run(args.run_report):
+        print(f"Run report written to {args.run_report}")
+    sys.exit(status)
@@ -0,0 +1,28 @@
+"""
+Anomaly checks on detected refills, shared by the report flags and alerting
+"""
+from datetime import timedelta
+
+REFILL_BURST_WINDOW = timedelta(hours=24)
+REFILL_BURST_THRESHOLD = 5
+
+
+def find_refill_burst(refill_times, window=REFILL_BURST_WINDOW, threshold=REFILL_BURST_THRESHOLD):
+    """
+    Find the first period of length `window` holding at least `threshold` refills.
+    Two-pointer scan over the sorted refill times.
+    Returns (window_start, window_end, refill_count) or None.
+    """
+    times = sorted(refill_times)
+    left = 0
+    for right, end_time in enumerate(times):
+        while times[left] < end_time - window:
+            left += 1
+        count = right - left + 1
+        if count >= threshold:
+            # Include refills at exactly the same time as the window end
+            while right + 1 < len(times) and times[right + 1] == end_time:
+                right += 1
+                count += 1
+            return times[left], end_time, count
+    return None
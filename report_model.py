@@ -0,0 +1,55 @@
+"""
+Typed results of the fuel analysis. fuel_analysis.build_report computes them once,
+the Excel and table renderers only format them.
+"""
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import List, Optional, Tuple
+
+
+@dataclass
+class Refill:
+    __slots__ = ('timestamp', 'min_fuel', 'max_fuel', 'added', 'consumption')
+    timestamp: datetime
+    min_fuel: float
+    max_fuel: float
+    added: float
+    consumption: float  # Since the previous refill (or the first reading), rounded to 0.01
+
+
+@dataclass
+class DailyRow:
+    __slots__ = ('date', 'distance', 'refill_amount', 'refill_count', 'start_fuel', 'end_fuel',
+                 'consumption', 'avg_consumption')
+    date: date
+    distance: float
+    refill_amount: float
+    refill_count: int
+    start_fuel: float
+    end_fuel: float
+    consumption: float
+    avg_consumption: Optional[float]  # Per 100 km, None without distance
+
+
+@dataclass
+class VehicleSummary:
+    __slots__ = ('name', 'urgent', 'urgent_window', 'total_distance', 'refill_total', 'refill_count',
+                 'consumption', 'avg_consumption', 'first_fuel', 'last_fuel')
+    name: str
+    urgent: bool
+    urgent_window: Optional[Tuple[datetime, datetime, int]]  # Refill burst from refill_alerts
+    total_distance: Optional[float]  # None without distance data
+    refill_total: float
+    refill_count: int
+    consumption: float  # Rounded to 0.01, 0 when negative
+    avg_consumption: Optional[float]  # Per 100 km, None without distance
+    first_fuel: float
+    last_fuel: float
+
+
+@dataclass
+class VehicleReport:
+    __slots__ = ('summary', 'refills', 'daily')
+    summary: VehicleSummary
+    refills: List[Refill]
+    daily: List[DailyRow]
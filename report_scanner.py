@@ -0,0 +1,119 @@
+"""
+Incremental scanner for the GPS portal HTML exports (fuel, engine and road reports)
+"""
+import os
+import re
+from html.parser import HTMLParser
+
+from instrumentation import count
+
+OBJECT_LABEL = 'Обьект:'
+DATE_LABEL = 'Хугацаа:'
+DATA_PATTERN = re.compile(r'data":\s*(\[.*?\])\s*,\s*"data_index', re.DOTALL)
+CHUNK_SIZE = 1024 * 1024
+
+
+class ReportScanner(HTMLParser):
+    """
+    Event-based scanner that only keeps the table/script being read in memory.
+
+    Events are collected in `events` in document order:
+      ('object', identifier, date_range)  a header table with an 'Обьект:' row
+      ('data', data_array)                a data array found in a script block
+      ('distances', rows)                 cell texts of each row of the table that
+                                          follows an object table (the distance table)
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.events = []
+        self._tables = []
+        self._cells = []
+        self._text = []
+        self._script = None
+        self._distance_depth = None
+
+    def handle_starttag(self, tag, attrs):
+        self._flush_text()
+        if tag == 'script':
+            self._script = []
+        elif tag == 'table':
+            collect = self._distance_depth is not None and len(self._tables) == self._distance_depth
+            if collect:
+                self._distance_depth = None
+            self._tables.append({'labels': {}, 'pending': None, 'rows': [] if collect else None})
+        elif tag == 'tr' and self._tables:
+            table = self._tables[-1]
+            table['pending'] = None
+            if table['rows'] is not None:
+                table['rows'].append([])
+        elif tag == 'td':
+            label = None
+            if self._tables:
+                label, self._tables[-1]['pending'] = self._tables[-1]['pending'], None
+            self._cells.append({'pieces': [], 'value_for': label})
+
+    def handle_endtag(self, tag):
+        self._flush_text()
+        if tag == 'script' and self._script is not None:
+            script = ''.join(self._script)
+            self._script = None
+            for match in DATA_PATTERN.findall(script):
+                self.events.append(('data', match))
+        elif tag == 'td' and self._cells:
+            self._end_cell(self._cells.pop())
+        elif tag == 'table' and self._tables:
+            self._end_table(self._tables.pop())
+
+    def handle_data(self, data):
+        if self._script is not None:
+            self._script.append(data)
+        elif self._cells:
+            self._text.append(data)
+
+    def _flush_text(self):
+        # Join text split across feed() calls so it is stripped as one string
+        if self._text:
+            text = ''.join(self._text)
+            self._text = []
+            for cell in self._cells:
+                cell['pieces'].append(text)
+
+    def _end_cell(self, cell):
+        if not self._tables:
+            return
+        table = self._tables[-1]
+        text = ''.join(piece.strip() for piece in cell['pieces'])
+        if cell['value_for']:
+            table['labels'].setdefault(cell['value_for'], text)
+        elif ''.join(cell['pieces']) in (OBJECT_LABEL, DATE_LABEL):
+            table['pending'] = ''.join(cell['pieces'])
+        if table['rows']:
+            table['rows'][-1].append(text)
+
+    def _end_table(self, table):
+        if self._distance_depth is not None and len(self._tables) < self._distance_depth:
+            self._distance_depth = None
+        if OBJECT_LABEL in table['labels']:
+            self.events.append(('object', table['labels'][OBJECT_LABEL], table['labels'].get(DATE_LABEL)))
+            self._distance_depth = len(self._tables)
+        elif table['rows'] is not None:
+            self.events.append(('distances', table['rows']))
+
+
+def scan_report(file_path, chunk_size=CHUNK_SIZE):
+    """
+    Read a report file in chunks and yield scanner events as they are found
+    """
+    scanner = ReportScanner()
+    count('html_bytes_read', os.path.getsize(file_path))
+    with open(file_path, 'r', encoding='utf-8') as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            scanner.feed(chunk)
+            yield from scanner.events
+            scanner.events = []
+    scanner.close()
+    yield from scanner.events
@@ -0,0 +1,121 @@
+"""
+Machine-readable outputs for the computed report tables (summary, refills, daily).
+Excel is rendered separately by fuel_analysis.write_excel_report.
+"""
+import csv
+import gzip
+import json
+import os
+from datetime import date, datetime
+
+TABLE_NAMES = ('summary', 'refills', 'daily')
+
+
+def report_tables(reports):
+    """
+    Flatten the VehicleReports from fuel_analysis.build_report into one row list per table,
+    each row carrying its vehicle identifier. Values are the computed ones, not the Excel
+    display text: missing values are None and amounts keep full precision.
+    """
+    tables = {name: [] for name in TABLE_NAMES}
+    for report in reports:
+        summary = report.summary
+        window = summary.urgent_window
+        tables['summary'].append({
+            'Обьект': summary.name,
+            'Нийт явсан км': _float(summary.total_distance),
+            'Түлш дүүрлт /Л/': summary.refill_total,
+            'Түлш дүүргэсэн тоо': summary.refill_count,
+            'Түлш зарцуулалт /Л/': float(summary.consumption),
+            'Дундаж хэрэглээ/100км/': summary.avg_consumption,
+            'Эхний үлдэгдэл': summary.first_fuel,
+            'Эцсийн үлдэгдэл': summary.last_fuel,
+            'Яаралтай': summary.urgent,
+            # Refill burst behind the urgent flag, None without one
+            'Яаралтай эхэлсэн': window[0] if window else None,
+            'Яаралтай дууссан': window[1] if window else None,
+            'Яаралтай дүүргэлт': window[2] if window else None,
+        })
+
+        for refill in report.refills:
+            tables['refills'].append({
+                'Обьект': summary.name,
+                'Эхэлсэн хугацаа': refill.timestamp,
+                'Өмнөх түлш': refill.min_fuel,
+                'Дараах түлш': refill.max_fuel,
+                'Нэмсэн түлш': refill.added,
+                'Сүүлд дүүргэснээс хойш зарцуулалт': refill.consumption,
+            })
+
+        for day in report.daily:
+            tables['daily'].append({
+                'Обьект': summary.name,
+                'Огноо': day.date,
+                'Нийт явсан км': day.distance,
+                'Түлш дүүрлт /Л/': day.refill_amount,
+                'Түлш дүүргэсэн тоо': day.refill_count,
+                'Түлш зарцуулалт /Л/': day.consumption,
+                'Дундаж хэрэглээ/100км/': day.avg_consumption,
+                'Эхний үлдэгдэл': day.start_fuel,
+                'Эцсийн үлдэгдэл': day.end_fuel,
+            })
+    return tables
+
+
+def _float(value):
+    return None if value is None else float(value)
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def write_csv(rows, path):
+    with gzip.open(path, 'wt', encoding='utf-8', newline='') as file:
+        if rows:
+            writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def write_ndjson(rows, path):
+    with open(path, 'w', encoding='utf-8') as file:
+        for row in rows:
+            file.write(json.dumps(row, ensure_ascii=False, default=_json_default))
+            file.write('\n')
+
+
+def write_parquet(rows, path):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet output requires pyarrow: pip install pyarrow")
+    pq.write_table(pa.Table.from_pylist(rows), path)
+
+
+SINKS = {
+    'csv': ('.csv.gz', write_csv),
+    'ndjson': ('.ndjson', write_ndjson),
+    'parquet': ('.parquet', write_parquet),
+}
+
+
+def write_tables(tables, output_format, output_dir, prefix='fuel_analysis'):
+    """
+    Write every table to output_dir as <prefix>_<table><extension>.
+    Returns the written file paths.
+    """
+    if output_format not in SINKS:
+        raise ValueError(f"Unknown output format: {output_format} (expected one of {', '.join(SINKS)})")
+    extension, write = SINKS[output_format]
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for name in TABLE_NAMES:
+        path = os.path.join(output_dir, f"{prefix}_{name}{extension}")
+        write(tables[name], path)
+        paths.append(path)
+    return paths
@@ -0,0 +1,92 @@
+"""
+On-disk cache of computed reports, keyed by the content of the input files and the
+analysis parameters. The least recently used entries are evicted above a size limit.
+"""
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+CACHE_VERSION = 1  # Bump when the cached report structure changes
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+ENTRY_SUFFIX = '.pkl'
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Pickled results in one file per key. Reading an entry marks it as recently used
+    (its mtime), writing one evicts the oldest entries until the cache fits max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key(self, file_paths, parameters):
+        """
+        SHA-256 over the cache version, the parameters and the content of every file
+        (None for a missing optional file)
+        """
+        digest = hashlib.sha256()
+        digest.update(json.dumps({'version': CACHE_VERSION, 'parameters': parameters},
+                                 sort_keys=True, default=str).encode('utf-8'))
+        for file_path in file_paths:
+            digest.update(b'-' if file_path is None else file_digest(file_path).encode('ascii'))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                value = pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, ValueError) as e:
+            print(f"Ignoring unreadable cache entry {path}: {e}")
+            os.remove(path)
+            return None
+        os.utime(path)
+        return value
+
+    def put(self, key, value):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self._path(key))
+        self.evict()
+
+    def evict(self):
+        # Entries can disappear under us when batch workers share the cache
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(ENTRY_SUFFIX):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
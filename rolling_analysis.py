@@ -0,0 +1,100 @@
+"""
+Rolling analysis over the stored series history. Every export is appended to a
+SeriesStore and refills are detected over the stitched series of each vehicle, so
+a refill or look-back window that crosses an export boundary is not cut off.
+"""
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+from fuel_analysis import detect_refills, store_series
+
+# Must cover the 120 minute look-back (plus the 10 minute data check) before a
+# refill and the look-ahead/merge window after it
+ROLLING_OVERLAP_MINUTES = 180
+STATE_FILE = 'rolling_state.json'
+EPOCH = datetime(1970, 1, 1)
+
+
+def _refill_ms(refill):
+    # detect_refills reports naive UTC start times
+    return int(round((refill['timestamp'] - EPOCH).total_seconds() * 1000))
+
+
+class RollingAnalysis:
+    """
+    Each run reports a vehicle's period from where its previous run settled up to
+    overlap_minutes before its last stored point; the rest is settled by the next run
+    once the points after it are known. Only the period and the overlap before it are
+    reprocessed. Running again without new points reports the same period again.
+
+    State file layout (next to the store):
+      {"<identifier>": {"start": ms, "end": ms, "last": ms}}
+    """
+
+    def __init__(self, store, overlap_minutes=ROLLING_OVERLAP_MINUTES):
+        self.store = store
+        self.overlap_ms = int(overlap_minutes * 60000)
+        self.path = os.path.join(store.directory, STATE_FILE)
+        self.periods = {}
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                self.periods = dict(json.load(file))
+        except FileNotFoundError:
+            pass
+        except (ValueError, TypeError) as e:
+            print(f"Ignoring unreadable rolling state {self.path}: {e}")
+
+    def analyze(self, datasets, identifiers):
+        """
+        Append the parsed exports to the store and analyze the new period of every vehicle.
+        Returns a (refills, stats, data) tuple per dataset, like analyze_files builds them.
+        """
+        store_series(self.store, datasets, identifiers)
+        results = [self._analyze_period(series, identifier)
+                   for series, identifier in zip(datasets, identifiers)]
+        self.write()
+        return results
+
+    def _period(self, series, identifier, last):
+        previous = self.periods.get(identifier)
+        if previous and previous['last'] == last:
+            return previous['start'], previous['end']
+        if previous:
+            start = previous['end']
+        elif series.is_valid:
+            start = int(series.timestamps[0])
+        else:
+            start = last
+        return start, max(start, last - self.overlap_ms)
+
+    def _analyze_period(self, series, identifier):
+        timestamps, fuel = self.store.load(identifier)
+        if not len(timestamps):
+            return [], {'num_refills': 0, 'first_fuel': None, 'last_fuel': None}, series.data
+
+        last = int(timestamps[-1])
+        start, end = self._period(series, identifier, last)
+        self.periods[identifier] = {'start': start, 'end': end, 'last': last}
+
+        # Detection runs from one overlap before the period to the newest point
+        lo, begin, stop = np.searchsorted(timestamps, [start - self.overlap_ms, start, end])
+        window = list(zip(timestamps[lo:].tolist(), fuel[lo:].astype(np.float64).tolist()))
+        refills = [refill for refill in detect_refills(window) if start <= _refill_ms(refill) < end]
+
+        # The level carried over from the previous period is where this one starts
+        points = window[begin - lo:stop - lo]
+        first_fuel = window[begin - lo - 1][1] if begin > lo else (points[0][1] if points else None)
+        last_fuel = points[-1][1] if points else first_fuel
+        stats = {'num_refills': len(refills), 'first_fuel': first_fuel, 'last_fuel': last_fuel}
+        return refills, stats, points or None
+
+    def write(self):
+        os.makedirs(self.store.directory, exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.periods, file, ensure_ascii=False, indent=1)
+        os.replace(temp_path, self.path)
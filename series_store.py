@@ -0,0 +1,103 @@
+"""
+Append-only columnar store of parsed vehicle series. Every vehicle has a directory with,
+per series ('fuel', 'engine'), an int64 millisecond timestamp column (<series>.ts) and
+a float32 value column (<series>.val) that are read back with np.memmap.
+"""
+import os
+from datetime import date, datetime, time
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+TIMESTAMP_DTYPE = np.dtype('<i8')
+VALUE_DTYPE = np.dtype('<f4')
+
+
+def _ms(value):
+    # Timestamps are epoch milliseconds; dates and datetimes are local time like the reports
+    if isinstance(value, datetime):
+        return int(value.timestamp() * 1000)
+    if isinstance(value, date):
+        return int(datetime.combine(value, time()).timestamp() * 1000)
+    return int(value)
+
+
+class SeriesStore:
+    """
+    Points are only ever appended in timestamp order, so a date range is a
+    searchsorted slice of the memory-mapped columns
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _paths(self, identifier, series):
+        base = os.path.join(self.directory, quote(identifier, safe=''), series)
+        return base + '.ts', base + '.val'
+
+    def identifiers(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(unquote(name) for name in os.listdir(self.directory)
+                      if os.path.isdir(os.path.join(self.directory, name)))
+
+    def _length(self, identifier, series):
+        # Rows present in both columns, an interrupted append may have written only one
+        ts_path, val_path = self._paths(identifier, series)
+        try:
+            return min(os.path.getsize(ts_path) // TIMESTAMP_DTYPE.itemsize,
+                       os.path.getsize(val_path) // VALUE_DTYPE.itemsize)
+        except FileNotFoundError:
+            return 0
+
+    def _columns(self, identifier, series):
+        count = self._length(identifier, series)
+        if not count:
+            return np.empty(0, TIMESTAMP_DTYPE), np.empty(0, VALUE_DTYPE)
+        ts_path, val_path = self._paths(identifier, series)
+        return (np.memmap(ts_path, TIMESTAMP_DTYPE, 'r', shape=(count,)),
+                np.memmap(val_path, VALUE_DTYPE, 'r', shape=(count,)))
+
+    def last_timestamp(self, identifier, series='fuel'):
+        timestamps, _ = self._columns(identifier, series)
+        return int(timestamps[-1]) if len(timestamps) else None
+
+    def append(self, identifier, series, timestamps, values):
+        """
+        Append points of one series. Points not newer than the last stored timestamp are
+        skipped, so overlapping exports can be appended as they come.
+        Returns the number of points added.
+        """
+        timestamps = np.asarray(timestamps)
+        values = np.asarray(values)
+        finite = np.isfinite(timestamps)
+        order = np.argsort(timestamps[finite], kind='stable')
+        timestamps = timestamps[finite][order].astype(TIMESTAMP_DTYPE)
+        values = values[finite][order].astype(VALUE_DTYPE)
+
+        last = self.last_timestamp(identifier, series)
+        if last is not None:
+            newer = timestamps > last
+            timestamps, values = timestamps[newer], values[newer]
+        if not len(timestamps):
+            return 0
+
+        ts_path, val_path = self._paths(identifier, series)
+        os.makedirs(os.path.dirname(ts_path), exist_ok=True)
+        count = self._length(identifier, series)
+        for path, dtype in ((ts_path, TIMESTAMP_DTYPE), (val_path, VALUE_DTYPE)):
+            with open(path, 'ab') as file:
+                # Drop rows of an interrupted append before adding new ones
+                file.truncate(count * dtype.itemsize)
+                file.write((timestamps if dtype is TIMESTAMP_DTYPE else values).tobytes())
+        return len(timestamps)
+
+    def load(self, identifier, start=None, end=None, series='fuel'):
+        """
+        Points of one series with start <= timestamp < end (epoch ms, date or datetime)
+        as read-only memory-mapped int64 timestamps and float32 values
+        """
+        timestamps, values = self._columns(identifier, series)
+        lo = 0 if start is None else int(np.searchsorted(timestamps, _ms(start), 'left'))
+        hi = len(timestamps) if end is None else int(np.searchsorted(timestamps, _ms(end), 'left'))
+        return timestamps[lo:hi], values[lo:hi]
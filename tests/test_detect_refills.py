@@ -0,0 +1,175 @@
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+from fuel_analysis import detect_refills, parse_data
+from report_scanner import scan_report
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+from synthetic_exports import generate_exports  # noqa: E402
+
+
+def baseline_detect_refills(data, threshold_percentage=5, time_window_minutes=60):
+    """detect_refills before the rewrite on binary search and sliding windows, kept as the reference"""
+    refills = []
+    in_refill = False
+    min_fuel = None
+    max_fuel = None
+    start_time = None
+    last_valid_fuel = None
+
+    def check_previous_fuel_levels(data, current_index, start_time, max_fuel):
+        check_start_time = start_time - timedelta(minutes=120)
+        comparison_fuel = max_fuel - 5
+        for j in range(current_index - 1, -1, -1):
+            check_time = datetime.utcfromtimestamp(data[j][0]/1000)
+            if check_time < check_start_time:
+                break
+            if check_time > start_time:
+                continue
+            if data[j][1] > comparison_fuel:
+                return True
+        return False
+
+    def find_real_start_time(data, start_idx, start_fuel):
+        real_start_idx = start_idx
+        for i in range(start_idx + 1, len(data)):
+            if data[i][1] > start_fuel:
+                real_start_idx = i - 1
+                break
+            if data[i][1] < start_fuel:
+                break
+        return datetime.utcfromtimestamp(data[real_start_idx][0]/1000)
+
+    def check_data_exists_in_window(data, check_time, current_index):
+        time_5min_before = check_time - timedelta(minutes=10)
+        time_30sec_after = time_5min_before + timedelta(seconds=30)
+        time_30sec_before = time_5min_before - timedelta(seconds=30)
+        for j in range(current_index - 1, -1, -1):
+            check_time = datetime.utcfromtimestamp(data[j][0]/1000)
+            if time_30sec_before < check_time < time_30sec_after:
+                return True
+            if check_time < time_5min_before:
+                break
+        return False
+
+    for i in range(1, len(data)):
+        prev_fuel = data[i-1][1]
+        current_fuel = data[i][1]
+        current_time = datetime.utcfromtimestamp(data[i][0]/1000)
+        if current_fuel == None:
+            current_fuel = 0
+        if prev_fuel == None:
+            prev_fuel = 0
+        if current_fuel >= 1:
+            last_valid_fuel = current_fuel
+
+        if current_fuel >= prev_fuel:
+            if not in_refill:
+                start_time = find_real_start_time(data, i-1, prev_fuel)
+                if check_data_exists_in_window(data, start_time, i-1):
+                    in_refill = True
+                    min_fuel = prev_fuel if prev_fuel >= 1 else last_valid_fuel
+            if in_refill:
+                max_fuel = current_fuel
+                last_time = current_time
+        elif in_refill:
+            in_refill = False
+            if min_fuel is not None and max_fuel is not None:
+                if min_fuel <= 0 and last_valid_fuel is not None:
+                    min_fuel = last_valid_fuel
+                percent_change = max_fuel - min_fuel
+                if min_fuel >= 0 and percent_change > threshold_percentage:
+                    valid_refill = True
+                    end_time = last_time + timedelta(minutes=time_window_minutes)
+                    if check_previous_fuel_levels(data, i, start_time, max_fuel):
+                        valid_refill = False
+                    else:
+                        for j in range(i, len(data)):
+                            if datetime.utcfromtimestamp(data[j][0]/1000) > end_time:
+                                break
+                            if data[j][1] <= min_fuel + (percent_change * 0.7):
+                                valid_refill = False
+                                break
+                    if valid_refill:
+                        if refills and (last_time - refills[-1]['timestamp']) <= timedelta(minutes=time_window_minutes):
+                            refills[-1]['max_fuel'] = max(refills[-1]['max_fuel'], max_fuel)
+                            refills[-1]['percent_change'] = refills[-1]['max_fuel'] - refills[-1]['min_fuel']
+                        else:
+                            refills.append({
+                                'timestamp': start_time,
+                                'percent_change': percent_change,
+                                'max_fuel': max_fuel,
+                                'min_fuel': min_fuel
+                            })
+            min_fuel, max_fuel = None, None
+
+    return refills
+
+
+def random_series(rng, n):
+    """
+    Walks, oscillations and plateaus sampled at steps around the 10 minute data check.
+    Whole liters in some series, so that levels hit the thresholds exactly.
+    """
+    t = 1709251200000 + rng.randrange(10**6)
+    fuel = rng.uniform(5, 60)
+    step = rng.choice([1000, 15000, 30000, 60000, 300000, 570000, 600000, 630000])
+    mode = rng.choice(['walk', 'oscillate', 'plateau'])
+    digits = rng.choice([0, 2])
+    data = []
+    for _ in range(n):
+        t += rng.choice([step, step, step // 2, 0, step * 3, 30000, 600000, 1440000])
+        r = rng.random()
+        if mode == 'oscillate':
+            fuel = 30 + rng.choice([-8, 8, 0, 12])
+        elif mode == 'plateau' and r < 0.7:
+            pass
+        elif r < 0.03:
+            fuel += rng.choice([rng.uniform(3, 40), 5, 10])
+        elif r < 0.05:
+            fuel = rng.choice([0, 0.5, fuel])
+        else:
+            fuel = max(0, fuel + rng.choice([-0.5, -0.2, 0, 0, 0.1, 0.3, 6, -6]))
+        data.append((float(t), round(fuel, digits)))
+    return data
+
+
+@pytest.mark.parametrize('parameters', [{}, {'threshold_percentage': 2, 'time_window_minutes': 30},
+                                        {'time_window_minutes': 240}])
+def test_same_refills_as_baseline_on_random_series(parameters):
+    rng = random.Random(5)
+    refills = 0
+    for _ in range(300):
+        data = random_series(rng, rng.choice([0, 1, 2, 5, 30, 200, 800]))
+        expected = baseline_detect_refills(data, **parameters)
+        assert detect_refills(data, **parameters) == expected
+        refills += len(expected)
+    assert refills > 50
+
+
+def test_same_refills_as_baseline_on_exported_series(tmp_path):
+    fuel_file, _, engine_file, _ = generate_exports(
+        str(tmp_path), vehicles=8, days=3, refills_per_day=2, two_tank_share=0.5, seed=7)
+    fuel_arrays = [event[1] for event in scan_report(fuel_file) if event[0] == 'data']
+    engine_arrays = [event[1] for event in scan_report(engine_file) if event[0] == 'data']
+    refills = 0
+    for fuel_array, engine_array in zip(fuel_arrays, engine_arrays):
+        data = parse_data(fuel_array, engine_array)
+        expected = baseline_detect_refills(data)
+        assert detect_refills(data) == expected
+        refills += len(expected)
+    assert refills > 0
+
+
+@pytest.mark.parametrize('earlier_level, refilled', [(25, True), (26, False)])
+def test_higher_level_before_refill_at_the_limit(earlier_level, refilled):
+    # Up to 5 liters under the refilled level may be seen in the 120 minutes before it
+    levels = [earlier_level] * 30 + [10] * 15 + [20, 30] + [29.9] * 90
+    data = [(1709251200000.0 + k * 60000, level) for k, level in enumerate(levels)]
+    expected = baseline_detect_refills(data)
+    assert detect_refills(data) == expected
+    assert bool(expected) == refilled
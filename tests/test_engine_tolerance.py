@@ -0,0 +1,25 @@
+import fuel_analysis
+from fuel_analysis import ParsedSeries, analysis_parameters, parse_data_arrays
+
+FUEL = '[500,"10"],[1500,"20"],[2500,"30"]'
+# Off from 0, on from 1000: with a 100 ms tolerance nothing sets the state of the
+# sample at 500, which starts from the last known state (on)
+ENGINE = '[0,"0"],[1000,"1"]'
+
+
+def test_any_age_by_default():
+    timestamps, fuel = parse_data_arrays(FUEL, ENGINE)
+    assert timestamps.tolist() == [1500.0, 2500.0]
+
+
+def test_tolerance_argument():
+    timestamps, fuel = parse_data_arrays(FUEL, ENGINE, engine_tolerance=100)
+    assert timestamps.tolist() == [500.0, 1500.0, 2500.0]
+    assert ParsedSeries(FUEL, ENGINE, engine_tolerance=100).timestamps.tolist() == [500.0, 1500.0, 2500.0]
+
+
+def test_module_setting_is_read_when_called(monkeypatch):
+    monkeypatch.setattr(fuel_analysis, 'ENGINE_TOLERANCE_MS', 100)
+    assert ParsedSeries(FUEL, ENGINE).timestamps.tolist() == [500.0, 1500.0, 2500.0]
+    assert analysis_parameters()['engine_tolerance_ms'] == 100
+    assert analysis_parameters(0)['engine_tolerance_ms'] == 0
@@ -0,0 +1,198 @@
+import base64
+import imaplib
+import quopri
+import re
+import threading
+
+import pytest
+
+import mail_fetch
+from mail_fetch import attachment_parts, fetch_parts, fetch_parts_concurrently, parse_fetch_response
+
+_BODY_ITEM = re.compile(r'BODY\.PEEK\[([\d.]+)\]<(\d+)\.(\d+)>')
+
+
+class FakeSession:
+    """
+    IMAP session over {uid: {section: encoded part}} answering UID FETCH of part slices
+    with data shaped like imaplib's: a (prefix, literal) tuple per slice, then b')'
+    """
+
+    def __init__(self, messages, uidvalidity=1, abort_on_fetch=None):
+        self.messages = messages
+        self.uidvalidity = uidvalidity
+        self.abort_on_fetch = abort_on_fetch  # Number of the FETCH that loses the connection
+        self.fetches = []
+        self.logged_out = False
+
+    def select(self, mailbox):
+        return 'OK', [b'%d' % sum(map(len, self.messages.values()))]
+
+    def response(self, code):
+        return code, [b'%d' % self.uidvalidity]
+
+    def uid(self, command, uids, items):
+        assert command == 'FETCH'
+        self.fetches.append((uids, items))
+        if len(self.fetches) == self.abort_on_fetch:
+            raise imaplib.IMAP4.abort('socket error: EOF')
+        data = []
+        for number, uid in enumerate(map(int, uids.split(',')), 1):
+            if uid not in self.messages:
+                continue
+            prefix = b'%d (UID %d' % (number, uid)
+            for section, offset, size in _BODY_ITEM.findall(items):
+                part = self.messages[uid].get(section)
+                if part is None:
+                    prefix += b' BODY[%s]<%s> NIL' % (section.encode(), offset.encode())
+                    continue
+                literal = part[int(offset):int(offset) + int(size)]
+                data.append((prefix + b' BODY[%s]<%s> {%d}' % (section.encode(), offset.encode(), len(literal)),
+                             literal))
+                prefix = b''
+            data.append(prefix + b')')
+        return 'OK', data
+
+    def logout(self):
+        self.logged_out = True
+
+
+class Writer:
+    def __init__(self):
+        self.data = b''
+        self.closed = self.discarded = False
+
+    def write(self, data):
+        self.data += data
+
+    def close(self):
+        self.closed = True
+
+    def discard(self):
+        self.discarded = True
+
+
+@pytest.fixture
+def small_slices(monkeypatch):
+    monkeypatch.setattr(mail_fetch, 'PART_CHUNK_SIZE', 16)
+    monkeypatch.setattr(mail_fetch, 'FETCH_BUDGET', 64)
+    monkeypatch.setattr(mail_fetch, 'RETRY_DELAY', 0)
+
+
+def encoded(payload, encoding):
+    if encoding == 'base64':
+        return base64.encodebytes(payload)
+    if encoding == 'quoted-printable':
+        return quopri.encodestring(payload)
+    return payload
+
+
+def test_parse_fetch_response_with_literals_quoted_strings_and_nil():
+    data = [(b'1 (UID 7 ENVELOPE ("Mon, 1 Apr 2024" {13}', 'Өдрийн тайлан'.encode()[:13]),
+            b' NIL NIL NIL NIL NIL NIL NIL "<a\\"b@x>") FLAGS (\\Seen))',
+            b'2 (UID 9 ENVELOPE (NIL "NIL" NIL NIL NIL NIL NIL NIL NIL NIL))']
+    responses = parse_fetch_response(data)
+    assert sorted(responses) == [7, 9]
+    envelope = responses[7]['ENVELOPE']
+    assert envelope[1] == 'Өдрийн тайлан'.encode()[:13]
+    assert envelope[2:9] == [None] * 7
+    assert envelope[9] == b'<a"b@x>'
+    assert responses[7]['FLAGS'] == [b'\\Seen']
+    # A quoted "NIL" is a string, not NIL
+    assert responses[9]['ENVELOPE'][:2] == [None, b'NIL']
+
+
+def test_attachment_parts_of_nested_multipart_and_attached_message():
+    structure = parse_fetch_response([
+        b'1 (UID 3 BODYSTRUCTURE ('
+        b'("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 10 1 NIL NIL NIL)'
+        b'("APPLICATION" "OCTET-STREAM" ("NAME" "tog.html") NIL NIL "BASE64" 400 NIL '
+        b'("ATTACHMENT" ("FILENAME*" "utf-8\'\'%D1%82%D2%AF%D0%BB%D1%88.html")) NIL)'
+        b'("MESSAGE" "RFC822" NIL NIL NIL "7BIT" 900 (NIL "Fwd" NIL NIL NIL NIL NIL NIL NIL NIL) '
+        b'(("TEXT" "PLAIN" NIL NIL NIL "7BIT" 5 1 NIL NIL NIL)'
+        b'("TEXT" "HTML" ("NAME" "zam.html") NIL NIL "QUOTED-PRINTABLE" 300 4 NIL ("INLINE" NIL) NIL)'
+        b' "MIXED" ("BOUNDARY" "b2") NIL NIL) 20 NIL ("ATTACHMENT" ("FILENAME" "fwd.eml")) NIL)'
+        b'("TEXT" "PLAIN" NIL NIL NIL "7BIT" 5 1 NIL NIL NIL)'
+        b' "MIXED" ("BOUNDARY" "b1") NIL NIL))'])[3]['BODYSTRUCTURE']
+    assert attachment_parts(structure) == [
+        ('2', 'түлш.html', 'base64'),
+        ('3', 'fwd.eml', '7bit'),
+        ('3.2', 'zam.html', 'quoted-printable'),
+    ]
+
+
+def test_attachment_parts_of_single_part_message():
+    structure = parse_fetch_response([
+        b'1 (UID 4 BODYSTRUCTURE ("TEXT" "HTML" ("NAME" "tulsh.html") NIL NIL "BASE64" 44 1 NIL '
+        b'("ATTACHMENT" NIL) NIL))'])[4]['BODYSTRUCTURE']
+    assert attachment_parts(structure) == [('1', 'tulsh.html', 'base64')]
+
+
+def test_fetch_parts_streams_multi_slice_parts(small_slices):
+    payloads = {
+        (10, '2'): b'<html>' + bytes(range(256)) + b'</html>',
+        (10, '3'): 'Түлш = 45.5 л\n'.encode() * 5,
+        (11, '2'): b'exactly 32 bytes of the payload!',  # Ends on a slice boundary
+        (12, '1'): b'short',
+    }
+    encodings = {(10, '2'): 'base64', (10, '3'): 'quoted-printable', (11, '2'): '7bit', (12, '1'): 'base64'}
+    messages = {}
+    for (uid, section), payload in payloads.items():
+        messages.setdefault(uid, {})[section] = encoded(payload, encodings[(uid, section)])
+    wanted = {uid: [(section, encodings[(uid, section)]) for section in sections] for uid, sections in messages.items()}
+    wanted[12].append(('9', 'base64'))  # Not in the message
+
+    session = FakeSession(messages)
+    done = fetch_parts(session, wanted, Writer)
+
+    assert {key: writer.data for key, writer in done.items()} == payloads
+    assert all(writer.closed and not writer.discarded for writer in done.values())
+    # Every slice was asked for once, in FETCHes of at most FETCH_BUDGET bytes
+    slices = sum(len(_BODY_ITEM.findall(items)) * len(uids.split(',')) for uids, items in session.fetches)
+    assert slices == sum(len(part) // 16 + 1 for sections in messages.values() for part in sections.values()) + 1
+    for uids, items in session.fetches:
+        assert len(uids.split(',')) * len(_BODY_ITEM.findall(items)) * 16 <= 64
+
+
+def test_fetch_parts_leaves_out_parts_the_server_did_not_return(small_slices):
+    session = FakeSession({20: {'2': b'x' * 40}})
+    done = fetch_parts(session, {20: [('2', '7bit')], 21: [('2', '7bit')]}, Writer)
+    assert list(done) == [(20, '2')]
+
+
+def test_fetch_parts_concurrently_retries_after_abort(small_slices):
+    messages = {uid: {'2': base64.encodebytes(b'%d' % uid * 30)} for uid in range(30, 40)}
+    sessions = []
+    lock = threading.Lock()
+
+    def connect():
+        with lock:
+            # The first session loses its connection in the middle of a multi-slice part
+            session = FakeSession(messages, abort_on_fetch=2 if not sessions else None)
+            sessions.append(session)
+        return session
+
+    writers = []
+
+    def open_part():
+        writers.append(Writer())
+        return writers[-1]
+
+    wanted = {uid: [('2', 'base64')] for uid in messages}
+    done = fetch_parts_concurrently(connect, wanted, 3, open_part, uidvalidity=1)
+
+    assert {key: writer.data for key, writer in done.items()} == {
+        (uid, '2'): b'%d' % uid * 30 for uid in messages}
+    assert len(sessions) == 4
+    # The slices read before the abort are thrown away, the part starts over
+    assert sum(writer.discarded for writer in writers) >= 1
+    assert all(writer.closed for writer in done.values())
+    assert sum(session.logged_out for session in sessions) == 3
+
+
+def test_fetch_parts_concurrently_stops_when_uidvalidity_changed(small_slices, capsys):
+    messages = {50: {'1': b'abc'}}
+    done = fetch_parts_concurrently(lambda: FakeSession(messages, uidvalidity=2), {50: [('1', '7bit')]}, 2,
+                                    Writer, uidvalidity=1)
+    assert done == {}
+    assert 'changed during the download' in capsys.readouterr().out
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from fuel_analysis import _parse_points, parse_data
+
+
+def test_well_formed_points():
+    timestamps, values, sortable = _parse_points('[[2000,"20.5"],[1000,"10"]]', 'fuel')
+    assert timestamps.tolist() == [2000.0, 1000.0]
+    assert values.tolist() == [20.5, 10.0]
+    assert sortable
+
+
+def test_missing_value_and_extra_field_do_not_shift_pairs():
+    # The two bad points have as many tokens together as two good ones
+    assert parse_data('[1000,"10"],[2000],[3000,"20",7],[4000,"30"],[5000,"40"]') == [
+        (1000.0, 10.0), (3000.0, 20.0), (4000.0, 30.0), (5000.0, 40.0)]
+
+
+@pytest.mark.parametrize('point', ['[2000, "20"]', '[2000,"20" ]', '["2000","20"]', '[2000,"x"]', '[20]00,"20"]'])
+def test_malformed_point_is_dropped(point):
+    assert parse_data(f'[1000,"10"],{point},[3000,"30"]') == [(1000.0, 10.0), (3000.0, 30.0)]
+
+
+def test_whitespace_inside_quotes_and_around_timestamp():
+    assert parse_data('[ 1000,"10"],[2000," 20"],[3000,30]') == [(1000.0, 10.0), (2000.0, 20.0), (3000.0, 30.0)]
+
+
+def test_unparseable_timestamp_keeps_file_order():
+    timestamps, values, sortable = _parse_points('[2000,"20"],[x,"15"],[1000,"10"]', 'fuel')
+    assert timestamps.tolist() == [2000.0, 1000.0]
+    assert not sortable
+
+
+def test_engine_states_are_truncated_and_finite():
+    timestamps, values, _ = _parse_points('[1000,"1.7"],[2000,"nan"],[3000,"0"]', 'engine')
+    assert timestamps.tolist() == [1000.0, 3000.0]
+    assert values.tolist() == [1.0, 0.0]
+    assert np.isfinite(values).all()
+
+
+def test_long_point_is_kept_next_to_malformed_one():
+    value = '1' + '0' * 80 + '.5'
+    points = parse_data(f'[1000,"10"],[2000,"x"],[3000,"{value}"]')
+    assert points == [(1000.0, 10.0), (3000.0, float(value))]
@@ -0,0 +1,82 @@
+import json
+import random
+
+import pytest
+
+from fuel_analysis import RefillDetector, detect_refills
+
+
+def random_series(rng):
+    """Fuel levels with long constant stretches (a stuck sensor), refills, slow use, gaps and zeros"""
+    t = 1.7e12
+    fuel = rng.uniform(20, 60)
+    data = []
+    for _ in range(rng.randint(2, 30)):
+        kind = rng.random()
+        if kind < 0.35:
+            for _ in range(rng.randint(1, 400)):
+                t += rng.choice([0, 30000, 60000, 60000, 590000, 610000])
+                data.append((t, fuel))
+        elif kind < 0.6:
+            for _ in range(rng.randint(1, 5)):
+                fuel = round(fuel + rng.uniform(1, 30), 1)
+                t += rng.choice([30000, 60000])
+                data.append((t, fuel))
+        elif kind < 0.95:
+            for _ in range(rng.randint(1, 200)):
+                fuel = round(max(0.5, fuel - rng.uniform(0, 0.3)), 1)
+                t += 60000
+                data.append((t, fuel))
+        else:
+            t += rng.choice([3600000, 9000000])
+            data.append((t, rng.choice([0, 0.5, fuel])))
+    return data
+
+
+def stream(data, rng, resume):
+    detector = RefillDetector()
+    refills = []
+    i = 0
+    while i < len(data):
+        step = rng.choice([1, 1, 1, 7, 100])
+        refills += detector.extend(data[i:i + step])
+        i += step
+        if resume and rng.random() < 0.3:
+            detector = RefillDetector.from_state(json.loads(json.dumps(detector.state())))
+    return refills + detector.finish()
+
+
+@pytest.mark.parametrize('resume', [False, True])
+def test_same_refills_as_detect_refills(resume):
+    rng = random.Random(7)
+    found = 0
+    for _ in range(150):
+        data = random_series(rng)
+        expected = detect_refills(data)
+        assert stream(data, rng, resume) == expected
+        found += len(expected)
+    assert found > 50
+
+
+def test_refill_after_long_constant_stretch():
+    t = 1.7e12
+    data = [(t + i * 60000, 40.0) for i in range(600)]
+    data.append((t + 600 * 60000, 70.0))
+    data += [(t + (601 + i) * 60000, 70.0 - i * 0.01) for i in range(300)]
+
+    detector = RefillDetector()
+    refills = []
+    for point in data:
+        refills += detector.push(*point)
+    assert refills + detector.finish() == detect_refills(data) != []
+
+
+def test_constant_fuel_keeps_buffer_bounded():
+    detector = RefillDetector()
+    for i in range(50000):
+        detector.push(1.7e12 + i * 30000, 42.0)
+    # 120 minutes of 30 s samples, at most twice that before a bulk trim
+    assert len(detector.times) <= 2 * 240 + 2
+    state = json.loads(json.dumps(detector.state()))
+    assert len(state['times']) == len(detector.times)
+    assert RefillDetector.from_state(state).finish() == []
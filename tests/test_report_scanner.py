@@ -0,0 +1,53 @@
+import os
+import re
+import sys
+
+import pytest
+
+from report_scanner import DATA_PATTERN, DATE_LABEL, OBJECT_LABEL, scan_report
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+from synthetic_exports import generate_exports  # noqa: E402
+
+bs4 = pytest.importorskip('bs4')
+
+
+def soup_events(file_path):
+    """The scanner events as the BeautifulSoup extraction the scanner replaced finds them"""
+    with open(file_path, 'r', encoding='utf-8') as file:
+        soup = bs4.BeautifulSoup(file.read(), 'html.parser')
+    distance_tables = set()
+    events = []
+    for element in soup.find_all(['script', 'table']):
+        if element.name == 'script' and element.string:
+            events.extend(('data', match) for match in re.findall(DATA_PATTERN, element.string))
+        elif element.name == 'table':
+            object_row = element.find('td', string=OBJECT_LABEL)
+            if object_row:
+                date_row = element.find('td', string=DATE_LABEL)
+                date_range = date_row.find_next_sibling('td').get_text(strip=True) if date_row else None
+                events.append(('object', object_row.find_next_sibling('td').get_text(strip=True), date_range))
+                distance_table = element.find_next_sibling('table')
+                if distance_table:
+                    distance_tables.add(id(distance_table))
+            elif id(element) in distance_tables:
+                rows = [[cell.get_text(strip=True) for cell in row.find_all('td')] for row in element.find_all('tr')]
+                events.append(('distances', rows))
+    return events
+
+
+@pytest.fixture(scope='module')
+def exports(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('exports')
+    fuel_file, road_file, engine_file, _ = generate_exports(
+        str(directory), vehicles=6, days=2, sample_seconds=300, two_tank_share=0.5, seed=3)
+    return {'fuel': fuel_file, 'road': road_file, 'engine': engine_file}
+
+
+@pytest.mark.parametrize('report', ['fuel', 'road', 'engine'])
+@pytest.mark.parametrize('chunk_size', [7, 4096, None])
+def test_scanner_matches_beautifulsoup(exports, report, chunk_size):
+    expected = soup_events(exports[report])
+    assert expected
+    events = list(scan_report(exports[report], chunk_size) if chunk_size else scan_report(exports[report]))
+    assert events == expected
@@ -0,0 +1,58 @@
+from datetime import datetime
+
+import openpyxl
+import pytest
+
+import fuel_analysis
+import instrumentation
+from fuel_analysis import SUMMARY_COLUMNS, write_excel_report
+from report_model import VehicleReport, VehicleSummary
+from report_sinks import report_tables
+
+
+def vehicle(name, urgent_window=None):
+    summary = VehicleSummary(name=name, urgent=urgent_window is not None, urgent_window=urgent_window,
+                             total_distance=120.0, refill_total=80.0, refill_count=5, consumption=60.0,
+                             avg_consumption=50.0, first_fuel=40.0, last_fuel=60.0)
+    return VehicleReport(summary, [], [])
+
+
+WINDOW = (datetime(2024, 3, 1, 8, 0), datetime(2024, 3, 1, 20, 30), 5)
+
+
+def test_summary_table_has_the_urgent_window():
+    rows = report_tables([vehicle('UAZ-1', WINDOW), vehicle('UAZ-2')])['summary']
+    assert [(row['Яаралтай'], row['Яаралтай эхэлсэн'], row['Яаралтай дууссан'], row['Яаралтай дүүргэлт'])
+            for row in rows] == [(True, *WINDOW), (False, None, None, None)]
+
+
+def test_excel_summary_shows_the_urgent_window(tmp_path):
+    output_file = str(tmp_path / 'report.xlsx')
+    write_excel_report([vehicle('UAZ-1', WINDOW), vehicle('UAZ-2')], ['2024-03-01 - 2024-03-02'], output_file)
+    rows = list(openpyxl.load_workbook(output_file).active.iter_rows(min_row=2, values_only=True))
+    column = SUMMARY_COLUMNS.index('Яаралтай хугацаа')
+    assert rows[0][column] == 'Яаралтай хугацаа'
+    assert rows[1][column] == '2024-03-01 08:00 - 2024-03-01 20:30: 5 дүүргэлт'
+    assert rows[4][0] == 'UAZ-2' and not rows[4][column]
+
+
+def test_unknown_output_format_is_rejected_before_the_analysis(monkeypatch):
+    def analyze_files(*args):
+        raise AssertionError("analyzed before the output format was checked")
+
+    monkeypatch.setattr(fuel_analysis, 'analyze_files', analyze_files)
+    with pytest.raises(ValueError, match='Unknown output format: xls'):
+        fuel_analysis.main('tulsh.html', 'zam.html', output_format='xls')
+
+
+def test_refill_burst_is_counted_not_printed(tmp_path, capsys):
+    start = datetime(2024, 3, 1, 8, 0)
+    refills = [{'timestamp': start.replace(hour=8 + k), 'percent_change': 20.0, 'max_fuel': 60.0, 'min_fuel': 40.0}
+               for k in range(5)]
+    stats = {'first_fuel': 50.0, 'last_fuel': 45.0, 'num_refills': len(refills)}
+    instrumentation.start_run()
+    reports = fuel_analysis.build_report([(refills, stats, [])], ['UAZ-1'], [[]], [[]])
+    run = instrumentation.finish_run(str(tmp_path / 'run.json'))
+    assert reports[0].summary.urgent_window == (start, start.replace(hour=12), 5)
+    assert run['counters']['refill_bursts'] == 1
+    assert 'refills between' not in capsys.readouterr().out
@@ -0,0 +1,56 @@
+"""
+Mapping between vehicles and the names of their fuel sensor series
+"""
+
+
+class IdentifierRegistry:
+    """
+    Series names by vehicle. A vehicle with one fuel sensor is reported under its own
+    identifier, one with several as "<identifier> 1", "<identifier> 2", ...
+    Both directions are dictionary lookups.
+    """
+
+    def __init__(self):
+        self.series = {}  # vehicle -> series names
+        self.vehicles = {}  # series name -> vehicle
+
+    def add(self, vehicle, count):
+        """Register count series of vehicle and return their names"""
+        names = [vehicle] if count == 1 else [f"{vehicle} {number}" for number in range(1, count + 1)]
+        self.series.setdefault(vehicle, []).extend(names)
+        for name in names:
+            self.vehicles[name] = vehicle
+        return names
+
+    @classmethod
+    def from_names(cls, names):
+        """
+        Rebuild a registry from series names alone: "<vehicle> 1" .. "<vehicle> N" with
+        N >= 2 are the sensors of one vehicle, any other name is a vehicle of its own
+        """
+        numbers = {}
+        for name in names:
+            vehicle, _, number = name.rpartition(' ')
+            if vehicle and number.isdigit():
+                numbers.setdefault(vehicle, set()).add(int(number))
+
+        registry = cls()
+        for name in names:
+            vehicle, _, number = name.rpartition(' ')
+            sensors = numbers.get(vehicle) if vehicle and number.isdigit() else None
+            if not sensors or len(sensors) < 2 or sensors != set(range(1, len(sensors) + 1)):
+                vehicle = name
+            registry.series.setdefault(vehicle, []).append(name)
+            registry.vehicles[name] = vehicle
+        return registry
+
+    def series_of(self, identifier):
+        """
+        Series names that belong to an identifier of a report: the series of the vehicle,
+        the identifier itself if it is a series name, or an empty list
+        """
+        if identifier in self.series:
+            return self.series[identifier]
+        if identifier in self.vehicles:
+            return [identifier]
+        return []